@@ -0,0 +1,293 @@
+# batch_processor.py
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from config import BATCH_DIR, BATCH_MAX_SIZE, BATCH_MAX_WAIT, BATCH_POLL_INTERVAL
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+
+class OpenAIBatchBackend:
+    """
+    Submits batch files to the OpenAI Batch API.
+    """
+
+    def __init__(self, client, directory: str = BATCH_DIR):
+        """
+        Args:
+            client (OpenAI): The OpenAI client.
+            directory (str): Directory where downloaded output files are stored.
+        """
+        self.client = client
+        self.directory = directory
+
+    def submit(self, input_path: str) -> str:
+        """
+        Uploads a JSONL request file and starts a batch.
+
+        Args:
+            input_path (str): Path to the JSONL request file.
+
+        Returns:
+            str: The batch id.
+        """
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id: str):
+        """
+        Checks the state of a batch and downloads its output once it is done.
+
+        Args:
+            batch_id (str): The batch id.
+
+        Returns:
+            tuple[str, list[str]]: The status ("in_progress", "completed", or "failed") and,
+                when completed, paths of the JSONL output and error files.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            return "failed", []
+        if batch.status != "completed":
+            return "in_progress", []
+
+        paths = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            path = os.path.join(self.directory, f"{batch_id}_{file_id}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self.client.files.content(file_id).text)
+            paths.append(path)
+        return "completed", paths
+
+class LocalBatchBackend:
+    """
+    Local stand-in for the Batch API. Executes each request of a batch file with a handler
+    on a background thread and writes the output file in the Batch API format.
+    """
+
+    def __init__(self, handler, directory: str = BATCH_DIR):
+        """
+        Args:
+            handler (callable): Called with the request body (dict); returns the response body (dict).
+            directory (str): Directory where output files are written.
+        """
+        self.handler = handler
+        self.directory = directory
+        self._batches = {}
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        output_path = os.path.join(self.directory, f"{batch_id}_output.jsonl")
+        done = threading.Event()
+        self._batches[batch_id] = (done, output_path)
+        threading.Thread(target=self._process, args=(input_path, output_path, done), daemon=True).start()
+        return batch_id
+
+    def _process(self, input_path: str, output_path: str, done: threading.Event):
+        with open(input_path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with open(output_path, "w", encoding="utf-8") as out:
+            for request in requests:
+                line = {"id": uuid.uuid4().hex, "custom_id": request["custom_id"], "response": None, "error": None}
+                try:
+                    line["response"] = {"status_code": 200, "body": self.handler(request["body"])}
+                except Exception as e:
+                    line["error"] = {"message": str(e)}
+                out.write(json.dumps(line) + "\n")
+        done.set()
+
+    def poll(self, batch_id: str):
+        done, output_path = self._batches[batch_id]
+        if not done.is_set():
+            return "in_progress", []
+        del self._batches[batch_id]
+        return "completed", [output_path]
+
+class BatchProcessor:
+    """
+    Collects chat completion requests that do not need an immediate answer, submits them in
+    batches, and hands each result back to the caller waiting on its Future.
+
+    A batch is submitted when it reaches `max_batch_size` requests or when its oldest request
+    has waited `max_wait` seconds.
+    """
+
+    def __init__(self, backend, directory: str = BATCH_DIR, max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait: float = BATCH_MAX_WAIT, poll_interval: float = BATCH_POLL_INTERVAL):
+        """
+        Initializes the processor and starts its background thread.
+
+        Args:
+            backend: OpenAIBatchBackend, LocalBatchBackend, or an object with the same methods.
+            directory (str): Directory where JSONL batch files are written.
+            max_batch_size (int): Maximum number of requests per batch.
+            max_wait (float): Maximum time in seconds a request waits before its batch is submitted.
+            poll_interval (float): Time in seconds between status checks of submitted batches.
+        """
+        self.backend = backend
+        self.directory = directory
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending = []
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="batch-processor", daemon=True)
+        self._thread.start()
+
+    def submit(self, body: dict) -> Future:
+        """
+        Queues a chat completion request.
+
+        Args:
+            body (dict): Keyword arguments for `chat.completions.create`.
+
+        Returns:
+            Future: Resolves to the response body (dict) of the request.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("BatchProcessor is closed.")
+            self._pending.append((f"request-{uuid.uuid4().hex}", body, future, time.monotonic()))
+            self._condition.notify_all()
+        return future
+
+    def close(self):
+        """
+        Submits the remaining requests and stops the background thread once all batches are done.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _take_due_batch(self):
+        """Removes and returns the next batch if it is due. Must be called with the lock held."""
+        if not self._pending:
+            return []
+        age = time.monotonic() - self._pending[0][3]
+        if len(self._pending) < self.max_batch_size and age < self.max_wait and not self._closed:
+            return []
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        return batch
+
+    def _next_timeout(self):
+        """Returns how long the background thread may sleep. Must be called with the lock held."""
+        timeouts = []
+        if self._pending:
+            timeouts.append(self.max_wait - (time.monotonic() - self._pending[0][3]))
+        if self._in_flight:
+            timeouts.append(self.poll_interval)
+        return max(0, min(timeouts)) if timeouts else None
+
+    def _loop(self):
+        last_poll = 0.0
+        while True:
+            with self._condition:
+                batch = self._take_due_batch()
+                if not batch:
+                    if self._closed and not self._pending and not self._in_flight:
+                        return
+                    self._condition.wait(timeout=self._next_timeout())
+                    batch = self._take_due_batch()
+
+            if batch:
+                self._submit_batch(batch)
+            if time.monotonic() - last_poll >= self.poll_interval:
+                last_poll = time.monotonic()
+                self._poll_batches()
+
+    def _submit_batch(self, batch):
+        input_path = os.path.join(self.directory, f"batch_{uuid.uuid4().hex}.jsonl")
+        try:
+            with open(input_path, "w", encoding="utf-8") as f:
+                for custom_id, body, _, _ in batch:
+                    f.write(json.dumps({
+                        "custom_id": custom_id,
+                        "method": "POST",
+                        "url": CHAT_COMPLETIONS_ENDPOINT,
+                        "body": body
+                    }) + "\n")
+            batch_id = self.backend.submit(input_path)
+        except Exception as e:
+            logging.exception("Failed to submit batch.")
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            self._remove_files([input_path])
+            return
+        logging.info(f"Submitted batch {batch_id} with {len(batch)} requests.")
+        with self._condition:
+            self._in_flight[batch_id] = (input_path, {custom_id: future for custom_id, _, future, _ in batch})
+
+    def _poll_batches(self):
+        with self._condition:
+            batch_ids = list(self._in_flight)
+        for batch_id in batch_ids:
+            try:
+                status, paths = self.backend.poll(batch_id)
+            except Exception:
+                logging.exception(f"Failed to poll batch {batch_id}.")
+                continue
+            if status == "in_progress":
+                continue
+
+            with self._condition:
+                input_path, futures = self._in_flight.pop(batch_id)
+            try:
+                if status == "completed":
+                    for path in paths:
+                        self._resolve(path, futures)
+            except Exception:
+                logging.exception(f"Failed to read the results of batch {batch_id}.")
+            finally:
+                # The files hold full prompts and responses; they are not needed once the futures are resolved
+                self._remove_files([input_path, *paths])
+            logging.info(f"Batch {batch_id} finished with status {status}.")
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Batch {batch_id} returned no result for this request."))
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logging.exception(f"Failed to remove batch file {path}.")
+
+    @staticmethod
+    def _resolve(output_path: str, futures: dict):
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                future = futures.get(result.get("custom_id"))
+                if future is None or future.done():
+                    continue
+                response = result.get("response") or {}
+                if result.get("error") or response.get("status_code") != 200:
+                    error = result.get("error") or response.get("body")
+                    future.set_exception(RuntimeError(f"Batch request failed: {error}"))
+                else:
+                    future.set_result(response["body"])
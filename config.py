@@ -1,13 +1,27 @@
 # config.py
 
 from key_manager import load_key, save_key, generate_key
+import json
+import logging
 import os
+import sys
+import threading
 
-# Paths to store the encrypted API keys
+# Encrypted keyring holding all API keys as one JSON object
+KEYRING_FILE = "keyring.enc"
+
+# Paths of the legacy per-key encrypted files (migrated into the keyring on first use)
 OPENAI_API_KEY_FILE = "openai_api_key.enc"
 GOOGLE_API_KEY_FILE = "google_api_key.enc"
 GOOGLE_SEARCH_ENGINE_KEY_FILE = "google_search_engine_key.enc"
 
+# Supported API keys: api_type -> (display name, environment variable, legacy file)
+API_KEY_TYPES = {
+    "openai": ("OpenAI", "OPENAI_API_KEY", OPENAI_API_KEY_FILE),
+    "google": ("Google", "GOOGLE_API_KEY", GOOGLE_API_KEY_FILE),
+    "google_search_engine_id": ("Google Search Engine ID", "GOOGLE_SEARCH_ENGINE_ID", GOOGLE_SEARCH_ENGINE_KEY_FILE),
+}
+
 # Encryption key file (32-byte key)
 # **Important**: In a real-world scenario, store this key securely and do not hardcode it.
 ENCRYPTION_KEY_FILE = "encryption.key"
@@ -15,6 +29,14 @@ ENCRYPTION_KEY_FILE = "encryption.key"
 # Notification sound file
 NOTIFICATION_SOUND_PATH = "notification.wav"
 
+# Progress event bus (notification.py)
+EVENT_QUEUE_SIZE = 10000          # Undelivered events kept before the oldest are dropped
+EVENT_SOUND = True                # Play the notification sound when a run completes
+EVENT_STDOUT = False              # Print every event
+EVENT_LOG_PATH = None             # JSON Lines file receiving every event, e.g. "events.jsonl"
+EVENT_WEBHOOK_URL = None          # Local webhook receiving events, e.g. "http://127.0.0.1:9000/events"
+EVENT_WEBHOOK_TIMEOUT = 5         # Seconds per webhook request
+
 # GPT Models
 GPT_MODELS = {
     "high_level": "gpt-4o",           # High-level tasks
@@ -23,6 +45,66 @@ GPT_MODELS = {
     "mini": "o1-mini"
 }
 
+# Estimated prices in USD per 1M tokens: model -> (input, output)
+GPT_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "o1-preview": (15.00, 60.00),
+    "o1-mini": (3.00, 12.00)
+}
+
+# Deferred requests sent through the Batch API (batch_processor.py)
+BATCH_DIR = "batches"             # JSONL request and result files
+BATCH_MAX_SIZE = 50               # Requests per batch
+BATCH_MAX_WAIT = 30               # Seconds a request waits for more requests before submission
+BATCH_POLL_INTERVAL = 15          # Seconds between batch status checks
+BATCH_PRICE_FACTOR = 0.5          # Batch requests are billed at this fraction of the interactive price
+
+# Long-term memory (persisted across ControlSystem runs)
+MEMORY_DIR = "memory"
+MEMORY_EMBEDDING_DIM = 512        # Dimension of the local hashing embedder
+MEMORY_TOP_K = 5                  # Maximum number of memories recalled per prompt
+MEMORY_TOKEN_BUDGET = 1500        # Approximate token budget for recalled memories
+
+# Plan execution
+PLAN_MAX_WORKERS = 4              # Subtasks executed in parallel
+
+# Run budgets and stuck-run detection (step_controller.py)
+RUN_TOKEN_BUDGET = 200_000        # Total tokens per run
+RUN_COST_BUDGET = 1.00            # Estimated USD per run
+RUN_TIME_BUDGET = 15 * 60         # Wall-clock seconds per run
+MAX_REPEATED_ACTIONS = 3          # Stop a subtask after the same action with the same result this many times
+MAX_REPEATED_ERRORS = 3           # Stop a subtask after this many consecutive or identical errors
+MAX_CYCLE_LENGTH = 3              # Longest repeating sequence of steps detected as a cycle
+
+# Code execution (execute_code_file tool)
+CODE_EXEC_TIMEOUT = 10                        # Default wall-clock timeout in seconds
+CODE_EXEC_MAX_TIMEOUT = 300                   # Upper bound for a timeout requested per call
+CODE_EXEC_OUTPUT_HEAD_BYTES = 32 * 1024       # Bytes kept from the start of stdout/stderr
+CODE_EXEC_OUTPUT_TAIL_BYTES = 32 * 1024       # Bytes kept from the end of stdout/stderr
+CODE_EXEC_CPU_SECONDS = 60                    # RLIMIT_CPU
+CODE_EXEC_MEMORY_BYTES = 1024 * 1024 * 1024   # RLIMIT_AS
+CODE_EXEC_FILE_SIZE_BYTES = 100 * 1024 * 1024 # RLIMIT_FSIZE
+# RLIMIT_NPROC counts every process of the user, not only the script's children, so a low value makes
+# subprocess and fork fail inside scripts on an ordinary desktop account. Opt-in, e.g. 64 for a dedicated user.
+CODE_EXEC_MAX_PROCESSES = None
+
+# HTTP service mode (service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_WORKERS = 2               # Goals executed at the same time (goals waiting on a batch do not count)
+SERVICE_DB_PATH = "jobs.db"       # Persistent job queue
+SERVICE_EVENT_RETENTION = 300     # Seconds a finished job's progress events stay in memory
+SERVICE_CANCEL_POLL_INTERVAL = 1  # Seconds between cancellation checks while a job waits for a batch
+
+# Page fetching (fetch_urls tool)
+FETCH_MAX_WORKERS = 8             # URLs fetched concurrently
+FETCH_MAX_PER_HOST = 2            # Concurrent requests to a single host
+FETCH_TIMEOUT = 10                # Seconds per request
+FETCH_MAX_BYTES = 2 * 1024 * 1024 # Response bodies are cut off after this many bytes
+FETCH_TOKEN_BUDGET = 6000         # Approximate token budget for all fetched pages together
+FETCH_CACHE_SIZE = 256            # Pages kept in the revalidation cache
+
 def get_encryption_key():
     """
     Retrieves the encryption key from the encryption key file.
@@ -41,39 +123,120 @@ def get_encryption_key():
         key = load_key(ENCRYPTION_KEY_FILE)
     return key
 
+class SecretStore:
+    """
+    Process-wide cache of decrypted API keys.
+
+    Keys are looked up in environment variables first, then in the encrypted keyring file.
+    The keyring is decrypted once and only reloaded when its modification time changes.
+    """
+
+    def __init__(self, keyring_file: str = KEYRING_FILE):
+        """
+        Initializes the store.
+
+        Args:
+            keyring_file (str): Path to the encrypted keyring file.
+        """
+        self.keyring_file = keyring_file
+        self._lock = threading.Lock()
+        self._encryption_key = None
+        self._secrets = {}
+        self._mtime = None
+
+    def _cipher_key(self):
+        if self._encryption_key is None:
+            self._encryption_key = get_encryption_key()
+        return self._encryption_key
+
+    def _refresh(self):
+        """Reloads the keyring if it changed on disk. Must be called with the lock held."""
+        try:
+            mtime = os.stat(self.keyring_file).st_mtime_ns
+        except FileNotFoundError:
+            self._secrets, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            self._secrets = json.loads(load_key(self.keyring_file, self._cipher_key()))
+            self._mtime = mtime
+
+    def _save(self):
+        """Encrypts and writes the keyring atomically. Must be called with the lock held."""
+        temp_file = f"{self.keyring_file}.tmp"
+        save_key(json.dumps(self._secrets), self._cipher_key(), temp_file, None)
+        os.replace(temp_file, self.keyring_file)
+        self._mtime = os.stat(self.keyring_file).st_mtime_ns
+
+    def set(self, api_type: str, value: str):
+        """
+        Stores an API key in the keyring.
+
+        Args:
+            api_type (str): Type of API key.
+            value (str): The API key.
+        """
+        with self._lock:
+            self._refresh()
+            self._secrets[api_type] = value
+            self._save()
+
+    def get(self, api_type: str, interactive: bool = None) -> str:
+        """
+        Retrieves an API key.
+
+        Args:
+            api_type (str): Type of API key. Options: "openai", "google", "google_search_engine_id".
+            interactive (bool, optional): Whether the user may be prompted for a missing key.
+                Defaults to True only in the main thread of a process attached to a terminal.
+
+        Returns:
+            str: The API key.
+        """
+        api_type = api_type.lower()
+        if api_type not in API_KEY_TYPES:
+            raise ValueError("Unsupported API type. Choose 'openai', 'google', or 'google_search_engine_id'.")
+        prompt, env_var, legacy_file = API_KEY_TYPES[api_type]
+
+        value = os.environ.get(env_var)
+        if value:
+            return value
+
+        with self._lock:
+            self._refresh()
+            if api_type in self._secrets:
+                return self._secrets[api_type]
+
+            if os.path.exists(legacy_file):
+                logging.info(f"Migrating {prompt} from {legacy_file} to {self.keyring_file}.")
+                self._secrets[api_type] = load_key(legacy_file, self._cipher_key())
+                self._save()
+                return self._secrets[api_type]
+
+            if interactive is None:
+                interactive = threading.current_thread() is threading.main_thread() and sys.stdin.isatty()
+            if not interactive:
+                raise ValueError(f"{prompt} not found. Set the {env_var} environment variable or add it to {self.keyring_file}.")
+
+            print(f"{prompt} not found.")
+            value = input(f"Please enter your {prompt}: ").strip()
+            if not value:
+                raise ValueError(f"No {prompt} provided.")
+            self._secrets[api_type] = value
+            self._save()
+            print(f"{prompt} has been securely saved to {self.keyring_file}.")
+            return value
+
+_secret_store = SecretStore()
+
 def get_api_key(api_type="openai"):
     """
-    Retrieves the API key (OpenAI or Google) from the encrypted file.
-    If the key does not exist, prompts the user to input it and saves it securely.
+    Retrieves an API key (OpenAI or Google) from the environment or the encrypted keyring.
+    If the key does not exist and the process is interactive, prompts the user to input it and saves it securely.
 
     Args:
-        api_type (str): Type of API key to retrieve. Options: "openai", "google".
+        api_type (str): Type of API key to retrieve. Options: "openai", "google", "google_search_engine_id".
 
     Returns:
-        str: The decrypted API key or Search Engine ID.
+        str: The API key or Search Engine ID.
     """
-    key = get_encryption_key()
-
-    if api_type.lower() == "openai":
-        api_key_file = OPENAI_API_KEY_FILE
-        prompt = "OpenAI"
-    elif api_type.lower() == "google":
-        api_key_file = GOOGLE_API_KEY_FILE
-        prompt = "Google"
-    elif api_type.lower() == "google_search_engine_id":
-        api_key_file = GOOGLE_SEARCH_ENGINE_KEY_FILE
-        prompt = "Google Search Engine ID"
-    else:
-        raise ValueError("Unsupported API type. Choose 'openai', 'google', or 'google_search_engine_id'.")
-
-    if not os.path.exists(api_key_file):
-        print(f"{prompt} not found.")
-        api_key = input(f"Please enter your {prompt}: ").strip()
-        if not api_key:
-            raise ValueError(f"No {prompt} provided.")
-        save_key(api_key, key, api_key_file, None)
-        print(f"{prompt} has been securely saved to {api_key_file}.")
-    else:
-        api_key = load_key(api_key_file, key)
-
-    return api_key
+    return _secret_store.get(api_type)
@@ -1,84 +1,351 @@
 # control_system.py
 
 import logging
+import time
+import uuid
 from gpt_integration import GPTIntegration
-from notification import send_notification  # Ensure this function is implemented
+from notification import (
+    Event, EventBus, get_event_bus, PHASE_START, PHASE_END, PLAN, STEP, STOPPED, TOOL_ERROR, EVALUATION, SUMMARY,
+    RUN_COMPLETE
+)
+from memory import LongTermMemory
+from plan_scheduler import PlanScheduler, parse_plan, format_plan
+from step_controller import StepController
+from tool_memo import ToolMemo
+
+class RunCancelled(Exception):
+    """
+    Raised inside a run when cancellation has been requested.
+    """
 
 class ControlSystem:
     """
     Manages the high-level workflow for achieving user-defined goals.
     """
 
-    def __init__(self, goal: str):
+    def __init__(self, goal: str, memory: LongTermMemory = None, gpt: GPTIntegration = None,
+                 on_progress=None, cancel_event=None, event_bus: EventBus = None, defer_planning: bool = False,
+                 run_id: str = None, wait_deferred=None):
         """
         Initializes the ControlSystem with the user's goal.
 
         Args:
             goal (str): The high-level goal provided by the user.
+            memory (LongTermMemory, optional): Long-term memory shared across runs.
+                A memory backed by the default directory is created if not provided.
+            gpt (GPTIntegration, optional): GPT client to reuse. A new one is created if not provided.
+            on_progress (callable, optional): Called as `on_progress(event, data)` with progress updates.
+            cancel_event (threading.Event, optional): When set, the run stops at the next step.
+            event_bus (EventBus, optional): Receives the progress events of the run.
+                Defaults to the process-wide bus, which plays the notification sound on completion.
+            defer_planning (bool): Send the planning request as a deferred (batchable) request,
+                for goals that are queued rather than awaited interactively.
+            run_id (str, optional): Identifies the run in published events. Generated if not provided.
+            wait_deferred (callable, optional): Called with the Future of each batched request and returns
+                its result; see `GPTIntegration.send_message`. It may give up waiting once `cancel_event` is set.
         """
         self.goal = goal
         self.execution_history = []
-        self.gpt = GPTIntegration()
+        self.plan = ""
+        self.subtasks = []
+        self.evaluation = ""
+        self.status = "pending"
+        self.controller = StepController()
+        self.tool_memo = ToolMemo()
+        self.gpt = gpt if gpt is not None else GPTIntegration()
+        self.memory = memory if memory is not None else LongTermMemory()
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.event_bus = event_bus if event_bus is not None else get_event_bus()
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        self.defer_planning = defer_planning
+        self.wait_deferred = wait_deferred
         logging.info(f"Initialized ControlSystem with goal: {self.goal}")
 
     def run(self):
         """
         Executes the entire workflow: planning, executing tasks, and evaluating results.
+        The outcome is stored in `self.status` ("completed", "failed", or "cancelled").
         """
         try:
+            self.status = "running"
+
             # Step 1: Define Goal
-            self.define_goal()
+            self.run_phase("define_goal", self.define_goal)
 
             # Step 2: Planning
-            self.create_plan()
+            self.run_phase("create_plan", self.create_plan)
 
             # Step 3: Executing the Plan
-            self.execute_plan()
+            self.run_phase("execute_plan", self.execute_plan)
 
             # Step 4: Evaluation
-            self.evaluate_results()
+            self.run_phase("evaluate_results", self.evaluate_results)
 
-            # Step 5: Notification
-            self.notify_user()
+            summary = self.summary()
+            logging.info(f"Run summary: {summary}")
+            self.report(SUMMARY, **summary)
 
-            logging.info("ControlSystem run completed successfully.")
+            # A run whose budget ran out before any step was taken has not carried out its plan
+            if self.controller.steps == 0 and "run" in self.controller.stop_reasons:
+                self.status = "failed"
+                logging.error(f"No steps were executed: {self.controller.stop_reasons['run']}")
+            else:
+                # Step 5: Remember the run for future goals
+                self.memory.record_run(self.goal, self.plan, self.execution_history)
+
+                self.status = "completed"
+                logging.info("ControlSystem run completed successfully.")
+
+        except RunCancelled:
+            self.status = "cancelled"
+            logging.info("ControlSystem run cancelled.")
 
         except Exception as e:
+            self.status = "failed"
             logging.exception("An unexpected error occurred in ControlSystem.")
             print("An error occurred. Please check 'progress.log' for details.")
 
+        # Step 6: Notification
+        self.report(RUN_COMPLETE, goal=self.goal, status=self.status)
+
+    def report(self, event: str, **data):
+        """
+        Publishes a progress event on the event bus and passes it to the `on_progress` callback, if any.
+
+        Args:
+            event (str): The event type, e.g. PHASE_START or STEP.
+            **data: Details of the event.
+        """
+        self.event_bus.publish(Event(event, self.run_id, **data))
+        if self.on_progress is not None:
+            try:
+                self.on_progress(event, data)
+            except Exception:
+                logging.exception("Progress callback failed.")
+
+    def wait_for_batch(self, future):
+        """
+        Waits for the result of a batched request. The wait does not count against the run's time budget,
+        since a batch can take far longer than the run itself.
+
+        Args:
+            future (Future): The pending request.
+
+        Returns:
+            dict: The response body.
+        """
+        with self.controller.paused():
+            if self.wait_deferred is not None:
+                return self.wait_deferred(future)
+            return future.result()
+
+    def check_cancelled(self):
+        """
+        Raises RunCancelled if cancellation has been requested.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RunCancelled()
+
+    def summary(self) -> dict:
+        """
+        Summarizes the resource usage of the run.
+
+        Returns:
+            dict: The step controller summary plus tool memo statistics.
+        """
+        return dict(self.controller.summary(), tool_memo=self.tool_memo.stats())
+
+    def report_tool_error(self, function_name: str, function_args: dict, result: str):
+        """
+        Reports a tool call that returned an error.
+
+        Args:
+            function_name (str): The tool name.
+            function_args (dict): The tool arguments.
+            result (str): The error returned by the tool.
+        """
+        self.report(TOOL_ERROR, tool=function_name, arguments=function_args, error=result)
+
+    def run_phase(self, phase: str, function):
+        """
+        Checks for cancellation, then runs a workflow phase, reporting its start and end.
+
+        Args:
+            phase (str): Name of the phase.
+            function (callable): The phase to run.
+        """
+        self.check_cancelled()
+        logging.info(f"Starting phase: {phase}")
+        self.report(PHASE_START, phase=phase)
+        started_at = time.monotonic()
+        function()
+        self.report(PHASE_END, phase=phase, duration=round(time.monotonic() - started_at, 3))
+
     def define_goal(self):
         """
         Defines the user's goal by communicating with GPT.
         """
         logging.info("Defining goal.")
         prompt = f"My goal is: {self.goal}\nPlease acknowledge the goal."
-        response = self.gpt.send_message(prompt, model="gpt-4o-mini")
+        response = self.gpt.send_message(prompt, model="gpt-4o-mini", tracker=self.controller, memo=self.tool_memo,
+                                         on_tool_error=self.report_tool_error)
         acknowledgment = response.strip()
         logging.info(f"Goal acknowledgment: {acknowledgment}")
 
     def create_plan(self):
         """
-        Uses GPT to create a detailed plan for achieving the goal.
+        Uses GPT to break the goal down into a dependency graph of subtasks.
+        Falls back to a single subtask covering the whole plan if the response cannot be parsed.
         """
         logging.info("Creating plan.")
-        prompt = f"My goal is: {self.goal}\nProvide a detailed step-by-step plan to achieve this goal. Answer with only the plan, without any unnecessary sentences."
-        response = self.gpt.send_message(prompt, model="gpt-4o")
-        self.plan = response.strip()
+        prompt = f"My goal is: {self.goal}\n"
+        past_plans = self.memory.recall(self.goal, kinds=("plan",))
+        if past_plans:
+            logging.info(f"Recalled {len(past_plans)} past plans.")
+            prompt += (
+                "Plans used for similar goals in the past:\n"
+                f"{self.memory.format_memories(past_plans)}\n"
+                "Reuse them where they apply.\n"
+            )
+        prompt += (
+            "Break this goal down into subtasks. Subtasks that do not depend on each other will be "
+            "executed in parallel by separate workers, so only declare a dependency when a subtask "
+            "needs the result of another one. "
+            "Answer with only a JSON object in this format, without any other text: "
+            '{"subtasks": [{"id": "1", "description": "...", "depends_on": []}, '
+            '{"id": "2", "description": "...", "depends_on": ["1"]}]}'
+        )
+        response = self.gpt.send_message(prompt, model="gpt-4o", tracker=self.controller, memo=self.tool_memo,
+                                         on_tool_error=self.report_tool_error,
+                                         deferred=self.defer_planning, wait=self.wait_for_batch)
+        # A deferred request may have been abandoned because the run was cancelled
+        self.check_cancelled()
+
+        try:
+            self.subtasks = parse_plan(response)
+        except ValueError as e:
+            logging.warning(f"Could not parse structured plan ({e}). Using it as a single subtask.")
+            self.subtasks = [{"id": "1", "description": response.strip(), "depends_on": []}]
+        self.plan = format_plan(self.subtasks)
         logging.info(f"Plan created: {self.plan}")
+        self.report(PLAN, plan=self.plan, subtasks=self.subtasks)
 
     def execute_plan(self):
         """
-        Executes the plan step-by-step, interacting with GPT to determine and perform each action.
+        Executes the plan by running each subtask in its own worker agent.
+        Independent subtasks run in parallel; results are merged into the execution history in plan order.
+        Subtasks stop early when the step controller detects that they are stuck or the run budget is spent.
         """
         logging.info("Executing the plan.")
-        for i in range(10):
+
+        def run_subtask(subtask, dependency_results):
+            agent = SubtaskAgent(self.gpt, self.memory, self.goal, self.plan, subtask, dependency_results,
+                                 self.controller, control=self)
+            return agent.run()
+
+        outcomes = PlanScheduler(self.subtasks).run(run_subtask)
+        self.check_cancelled()
+
+        for subtask in self.subtasks:
+            outcome = outcomes[subtask["id"]]
+            if outcome["status"] == "done":
+                entries = outcome["result"]
+            else:
+                entries = [{"action": subtask["description"], "result": outcome["result"]}]
+            for entry in entries:
+                self.execution_history.append(dict(entry, subtask=subtask["id"]))
+
+    def evaluate_results(self):
+        """
+        Evaluates the execution history against the goal by communicating with GPT.
+        """
+        logging.info("Evaluating results.")
+        history_content = "\n".join([
+            f"Step {idx + 1} (subtask {entry['subtask']}):\nAction: {entry['action']} \nResult: {entry['result']}\n"
+            for idx, entry in enumerate(self.execution_history)
+        ])
+        stop_content = "".join(
+            f"Execution of {scope if scope == 'run' else 'subtask ' + scope} was stopped early: {reason}\n"
+            for scope, reason in self.controller.stop_reasons.items()
+        )
+
+        prompt = (
+            f"Goal: {self.goal}\n"
+            "Execution History:\n"
+            f"{history_content}\n"
+            f"{stop_content}"
+            "Based on the execution history, evaluate how well the goal has been met. "
+            "Provide a detailed assessment."
+        )
+        # The evaluation is not needed interactively, so it can go through the batch endpoint.
+        # The run still waits for it before completing.
+        evaluation = self.gpt.send_message(prompt, model="gpt-4o-mini", tracker=self.controller, memo=self.tool_memo,
+                                           on_tool_error=self.report_tool_error, deferred=True,
+                                           wait=self.wait_for_batch)
+        self.check_cancelled()
+        self.evaluation = evaluation
+        logging.info(f"Evaluation: {evaluation}")
+        self.report(EVALUATION, evaluation=evaluation)
+        # print(f"Evaluation:\n{evaluation}")
+
+class SubtaskAgent:
+    """
+    Worker agent that carries out a single subtask of the plan with its own execution history.
+    """
+
+    def __init__(self, gpt: GPTIntegration, memory: LongTermMemory, goal: str, plan: str,
+                 subtask: dict, dependency_results: dict, controller: StepController,
+                 control: ControlSystem = None):
+        """
+        Initializes the worker agent.
+
+        Args:
+            gpt (GPTIntegration): Shared GPT client.
+            memory (LongTermMemory): Long-term memory used to recall similar past actions.
+            goal (str): The overall goal.
+            plan (str): The overall plan, for context.
+            subtask (dict): The subtask to carry out.
+            dependency_results (dict): Execution histories of the subtasks this one depends on.
+            controller (StepController): Tracks budgets and decides when the subtask is stuck.
+            control (ControlSystem, optional): The owning run, used for progress reports and cancellation.
+        """
+        self.gpt = gpt
+        self.memory = memory
+        self.goal = goal
+        self.plan = plan
+        self.subtask = subtask
+        self.dependency_results = dependency_results
+        self.controller = controller
+        self.control = control
+        self.tool_memo = control.tool_memo if control is not None else None
+        self.on_tool_error = control.report_tool_error if control is not None else None
+        self.execution_history = []
+
+    def run(self):
+        """
+        Performs actions until GPT reports the subtask complete, the subtask stops making progress,
+        or the run budget is exhausted.
+
+        Returns:
+            list[dict]: The execution history of this subtask.
+        """
+        while True:
+            if self.control is not None:
+                self.control.check_cancelled()
+            budget_reason = self.controller.check_budget()
+            if budget_reason:
+                self.controller.stop("run", budget_reason)
+                if self.control is not None:
+                    self.control.report(STOPPED, subtask=self.subtask["id"], reason=budget_reason)
+                break
+
             next_action = self.get_next_action()
             if not next_action:
-                logging.info("No further actions determined by GPT. Ending execution.")
+                logging.info(f"Subtask {self.subtask['id']} complete.")
                 break
 
-            logging.info(f"Next action: {next_action}")
+            logging.info(f"Subtask {self.subtask['id']} next action: {next_action}")
             result = self.perform_action(next_action)
 
             # Save the result
@@ -86,28 +353,55 @@ class ControlSystem:
                 "action": next_action,
                 "result": result
             })
-            logging.info(f"Result of action: {result}")
+            logging.info(f"Subtask {self.subtask['id']} result of action: {result}")
+            if self.control is not None:
+                self.control.report(STEP, subtask=self.subtask["id"], action=next_action, result=result)
+
+            stuck_reason = self.controller.record_step(self.subtask["id"], next_action, result)
+            if stuck_reason:
+                self.controller.stop(self.subtask["id"], stuck_reason)
+                if self.control is not None:
+                    self.control.report(STOPPED, subtask=self.subtask["id"], reason=stuck_reason)
+                break
+        return self.execution_history
 
     def get_next_action(self):
         """
-        Determines the next action based on the execution history by communicating with GPT.
+        Determines the next action for the subtask based on its execution history by communicating with GPT.
 
         Returns:
-            str: The next action to perform or None if the plan is complete.
+            str: The next action to perform or None if the subtask is complete.
         """
         history_content = "\n".join([
             f"Action: {entry['action']}\nResult: {entry['result']}"
             for entry in self.execution_history
         ])
 
+        dependency_content = ""
+        for dep_id, entries in self.dependency_results.items():
+            dependency_content += f"Results of subtask {dep_id}:\n"
+            dependency_content += "\n".join(f"Action: {entry['action']}\nResult: {entry['result']}" for entry in entries)
+            dependency_content += "\n"
+
+        last_action = self.execution_history[-1]["action"] if self.execution_history else self.subtask["description"]
+        past_actions = self.memory.recall(f"{self.goal}\n{last_action}", kinds=("action",))
+        memory_content = ""
+        if past_actions:
+            memory_content = f"Successful actions from similar past goals:\n{self.memory.format_memories(past_actions)}\n"
+
         prompt = (
             f"Goal: {self.goal}\n"
-            f"Plan: {self.plan}\n"
+            f"Plan:\n{self.plan}\n"
+            f"Current subtask: {self.subtask['id']}. {self.subtask['description']}\n"
+            f"{dependency_content}"
+            f"{memory_content}"
             f"Execution History:\n{history_content}\n"
-            "Based on the above, what is the next action to take to achieve the goal? "
-            "Provide a clear and concise instruction. If the goal is achieved, respond with 'Plan complete'."
+            "Based on the above, what is the next action to take to complete the current subtask? "
+            "Only work on the current subtask; other subtasks are handled separately. "
+            "Provide a clear and concise instruction. If the subtask is complete, respond with 'Plan complete'."
         )
-        response = self.gpt.send_message(prompt, model="gpt-4o-mini")
+        response = self.gpt.send_message(prompt, model="gpt-4o-mini", tracker=self.controller, memo=self.tool_memo,
+                                         on_tool_error=self.on_tool_error)
         next_action = response.strip()
         print(next_action)
         if "plan complete" in next_action.lower():
@@ -125,34 +419,6 @@ class ControlSystem:
             str: The result of the action.
         """
         prompt = f"Action: {action}\nPlease perform this action and provide the result."
-        response = self.gpt.send_message(prompt, model="gpt-4o-mini")
+        response = self.gpt.send_message(prompt, model="gpt-4o-mini", tracker=self.controller, memo=self.tool_memo,
+                                         on_tool_error=self.on_tool_error)
         return response
-
-    def evaluate_results(self):
-        """
-        Evaluates the execution history against the goal by communicating with GPT.
-        """
-        logging.info("Evaluating results.")
-        history_content = "\n".join([
-            f"Step {idx + 1}:\nAction: {entry['action']} \nResult: {entry['result']}\n"
-            for idx, entry in enumerate(self.execution_history)
-        ])
-
-        prompt = (
-            f"Goal: {self.goal}\n"
-            "Execution History:\n"
-            f"{history_content}\n"
-            "Based on the execution history, evaluate how well the goal has been met. "
-            "Provide a detailed assessment."
-        )
-        evaluation = self.gpt.send_message(prompt, model="gpt-4o-mini")
-        logging.info(f"Evaluation: {evaluation}")
-        # print(f"Evaluation:\n{evaluation}")
-
-    def notify_user(self):
-        """
-        Alerts the user upon completion of the workflow.
-        """
-        logging.info("Sending notification to user.")
-        send_notification()
-        logging.info("Notification sent.")
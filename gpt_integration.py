@@ -3,7 +3,9 @@
 import logging
 from typing import Optional
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 from config import get_api_key
+from batch_processor import BatchProcessor, OpenAIBatchBackend
 import json
 import tools
 
@@ -12,26 +14,52 @@ class GPTIntegration:
     Handles interactions with OpenAI's GPT models.
     """
 
-    def __init__(self):
+    def __init__(self, batch_backend=None, use_batch: bool = False):
         """
         Initializes the GPTIntegration with the necessary configurations.
+
+        Args:
+            batch_backend (optional): Backend for deferred requests, e.g. a LocalBatchBackend.
+                Implies `use_batch`.
+            use_batch (bool): Send deferred requests through the OpenAI Batch API.
+                Without batching, deferred requests are sent interactively.
         """
         self.client = OpenAI(api_key=get_api_key())
+        self.batch_processor = None
+        if batch_backend is not None or use_batch:
+            self.batch_processor = BatchProcessor(batch_backend or OpenAIBatchBackend(self.client))
         logging.info("GPTIntegration initialized.")
 
-    def send_message(self, message: str, model: str = "gpt-4o-mini") -> str:
+    def close(self):
+        """
+        Waits for outstanding deferred requests and stops the batch processor.
+        """
+        if self.batch_processor is not None:
+            self.batch_processor.close()
+
+    def send_message(self, message: str, model: str = "gpt-4o-mini", tracker=None, memo=None,
+                     deferred: bool = False, on_tool_error=None, wait=None) -> str:
         """
         Sends a message to the specified GPT model and retrieves the response.
 
         Args:
             message (str): The message or prompt to send.
             model (str): The GPT model to use.
+            tracker (optional): Object with a `record_usage(model, prompt_tokens, completion_tokens)`
+                method that is told the token usage of the call, e.g. a StepController.
+            memo (ToolMemo, optional): Per-run memo table used to skip repeated tool calls.
+            deferred (bool): The answer is not needed in real time. If batching is enabled, the request
+                is sent through the batch endpoint and this call blocks until the batch completes.
+            on_tool_error (callable, optional): Called as `on_tool_error(function_name, function_args, result)`
+                when a tool call returns an error.
+            wait (callable, optional): Called with the Future of a batched request and returns its result,
+                letting the caller give up resources while the batch is processed. Defaults to `Future.result`.
 
         Returns:
             str: The response from the GPT model.
         """
         try:
-            response = self.client.chat.completions.create(
+            request = dict(
                 model=model,
                 messages=[
                     {"role": "system", "content": (
@@ -62,6 +90,16 @@ class GPTIntegration:
                 tools=tools.tools,
                 temperature=1,
             )
+            batched = deferred and self.batch_processor is not None
+            if batched:
+                future = self.batch_processor.submit(request)
+                body = wait(future) if wait is not None else future.result()
+                response = ChatCompletion.model_validate(body)
+            else:
+                response = self.client.chat.completions.create(**request)
+            if tracker is not None and response.usage is not None:
+                tracker.record_usage(model, response.usage.prompt_tokens, response.usage.completion_tokens,
+                                     batch=batched)
 
             reply = ''
             if response.choices[0].message.content:
@@ -69,7 +107,7 @@ class GPTIntegration:
             if model in ["gpt-4o-mini", "gpt-4o"] and response.choices[0].message.tool_calls:
                 tool_call_responses = []
                 for tool_call in response.choices[0].message.tool_calls:
-                    tool_call_responses.append(self.handle_tool_call(tool_call))
+                    tool_call_responses.append(self.handle_tool_call(tool_call, memo, on_tool_error))
                 reply += '\n\n' + "\n\n".join(tool_call_responses)
 
             # logging.info(f"GPT Response from {model}: {reply}")
@@ -79,18 +117,35 @@ class GPTIntegration:
             logging.exception("Error communicating with OpenAI API.")
             return f"An error occurred: {str(e)}"
         
-    def handle_tool_call(self, tool_call):
+    def handle_tool_call(self, tool_call, memo=None, on_tool_error=None):
         function_name = tool_call.function.name
         function_args = json.loads(tool_call.function.arguments)
-        
-        if function_name == "execute_code":
-            return tools.tool_execute_code(function_args["code"])
+
+        if memo is not None:
+            cached = memo.lookup(function_name, function_args)
+            if cached is not None:
+                return cached
+
+        result = self.dispatch_tool(function_name, function_args)
+        if memo is not None:
+            memo.record(function_name, function_args, result)
+        if on_tool_error is not None and result.lower().startswith("error"):
+            on_tool_error(function_name, function_args, result)
+        return result
+
+    def dispatch_tool(self, function_name, function_args):
+        if function_name == "execute_code_file":
+            return tools.tool_execute_code_file(function_args["file_path"], function_args.get("timeout"))
         elif function_name == "search_internet":
             return tools.tool_search_internet(function_args["query"])
+        elif function_name == "fetch_urls":
+            return tools.tool_fetch_urls(function_args["urls"])
         elif function_name == "read_file":
             return tools.tool_read_file(function_args["file_path"])
         elif function_name == "write_file":
             return tools.tool_write_file(function_args["file_path"], function_args["content"])
+        elif function_name == "delete_file":
+            return tools.tool_delete_file(function_args["file_path"])
         else:
             return f"Error: Unknown function {function_name}"
 
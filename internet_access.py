@@ -1,9 +1,21 @@
 # internet_access.py
 
 import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+import httpx
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from config import get_api_key  # Updated import to handle Google API key
+from memory import ERROR_PREFIXES
+from config import (
+    FETCH_MAX_WORKERS, FETCH_MAX_PER_HOST, FETCH_TIMEOUT,
+    FETCH_MAX_BYTES, FETCH_TOKEN_BUDGET, FETCH_CACHE_SIZE
+)
 
 def search_internet(query, max_results=5):
     """
@@ -54,3 +66,250 @@ def search_internet(query, max_results=5):
     except Exception as e:
         logging.error(f"Unexpected error occurred: {e}")
         return f"An unexpected error occurred: {str(e)}"
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the readable text of an HTML page, skipping scripts, styles, and page chrome.
+    """
+
+    SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg", "head", "nav", "footer", "header", "aside", "form"}
+    BLOCK_TAGS = {"p", "div", "br", "li", "tr", "section", "article", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "table"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+    def text(self):
+        text = "".join(self.parts)
+        text = re.sub(r"[ \t\r\f\v]+", " ", text)
+        text = re.sub(r"\n\s*\n+", "\n\n", text)
+        return text.strip()
+
+def extract_text(html: str) -> str:
+    """
+    Extracts readable text from an HTML document.
+
+    Args:
+        html (str): The HTML source.
+
+    Returns:
+        str: The page title (if any) followed by its readable text.
+    """
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    title = parser.title.strip()
+    body = parser.text()
+    return f"{title}\n\n{body}" if title else body
+
+class PageFetcher:
+    """
+    Fetches web pages concurrently over a pooled HTTP client and caches their extracted text.
+    Cached pages are revalidated with ETag / Last-Modified headers instead of being downloaded again.
+    """
+
+    def __init__(self, max_workers=FETCH_MAX_WORKERS, max_per_host=FETCH_MAX_PER_HOST,
+                 timeout=FETCH_TIMEOUT, max_bytes=FETCH_MAX_BYTES, cache_size=FETCH_CACHE_SIZE):
+        """
+        Initializes the fetcher.
+
+        Args:
+            max_workers (int): Maximum number of URLs fetched at the same time.
+            max_per_host (int): Maximum number of concurrent requests to one host.
+            timeout (float): Timeout in seconds for each request.
+            max_bytes (int): Response bodies are cut off after this many bytes.
+            cache_size (int): Number of pages kept in the cache.
+        """
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self.client = httpx.Client(
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_workers, max_keepalive_connections=max_workers),
+            headers={"User-Agent": "Mozilla/5.0 (compatible; AutonomousAgent/1.0)"}
+        )
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._host_limits = {}
+        self._host_lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def _cache_get(self, url):
+        with self._cache_lock:
+            entry = self._cache.get(url)
+            if entry is not None:
+                self._cache.move_to_end(url)
+            return entry
+
+    def _cache_put(self, url, entry):
+        with self._cache_lock:
+            self._cache[url] = entry
+            self._cache.move_to_end(url)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def fetch(self, url: str) -> str:
+        """
+        Fetches a single URL and returns its readable text.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            str: The extracted text of the page or an error message.
+        """
+        if urlsplit(url).scheme not in ("http", "https"):
+            return f"Error: Unsupported URL '{url}'. Only http and https URLs can be fetched."
+
+        cached = self._cache_get(url)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            with self._host_semaphore(url):
+                with self.client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached:
+                        logging.info(f"Page not modified, using cached copy: {url}")
+                        return cached["text"]
+                    response.raise_for_status()
+
+                    body = bytearray()
+                    truncated = False
+                    for chunk in response.iter_bytes():
+                        body.extend(chunk)
+                        if len(body) >= self.max_bytes:
+                            del body[self.max_bytes:]
+                            truncated = True
+                            break
+
+                    content_type = response.headers.get("content-type", "")
+                    raw = body.decode(response.encoding or "utf-8", errors="replace")
+                    etag = response.headers.get("etag")
+                    last_modified = response.headers.get("last-modified")
+        except httpx.HTTPStatusError as e:
+            logging.error(f"HTTP error occurred while fetching {url}: {e}")
+            return f"An error occurred while fetching the page: HTTP {e.response.status_code}"
+        except httpx.HTTPError as e:
+            logging.error(f"Error occurred while fetching {url}: {e}")
+            return f"An error occurred while fetching the page: {e}"
+
+        if "html" in content_type or (not content_type and raw.lstrip().startswith("<")):
+            text = extract_text(raw)
+        else:
+            text = raw.strip()
+        if truncated:
+            text += f"\n[Page truncated after {self.max_bytes} bytes]"
+
+        if etag or last_modified:
+            self._cache_put(url, {"etag": etag, "last_modified": last_modified, "text": text})
+        logging.info(f"Fetched {url} ({len(body)} bytes).")
+        return text
+
+    def fetch_many(self, urls, token_budget=FETCH_TOKEN_BUDGET):
+        """
+        Fetches several URLs concurrently.
+
+        Args:
+            urls (list[str]): The URLs to fetch.
+            token_budget (int): Approximate token budget shared evenly between the pages.
+
+        Returns:
+            list[tuple[str, str]]: (url, text) pairs in the order of `urls`.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            texts = list(executor.map(self.fetch, urls))
+
+        # Roughly 4 characters per token
+        max_chars = max(1, token_budget * 4 // len(urls))
+        results = []
+        for url, text in zip(urls, texts):
+            if len(text) > max_chars:
+                text = text[:max_chars] + "\n[Content truncated to fit the token budget]"
+            results.append((url, text))
+        return results
+
+    def close(self):
+        """Closes the underlying HTTP client."""
+        self.client.close()
+
+_page_fetcher = None
+_page_fetcher_lock = threading.Lock()
+
+def get_page_fetcher() -> PageFetcher:
+    """
+    Returns the process-wide PageFetcher, creating it on first use so that connections and cache are shared.
+    """
+    global _page_fetcher
+    with _page_fetcher_lock:
+        if _page_fetcher is None:
+            _page_fetcher = PageFetcher()
+        return _page_fetcher
+
+def fetch_urls(urls, token_budget=FETCH_TOKEN_BUDGET):
+    """
+    Downloads several web pages concurrently and returns their readable text.
+
+    Args:
+        urls (list[str]): The URLs to fetch. A single URL may be passed as a string.
+        token_budget (int): Approximate token budget for all pages together.
+
+    Returns:
+        str: The text of each page, headed by its URL, or an error message. If any page could not be
+            fetched, the result starts with "Error:" and still contains the pages that were fetched.
+    """
+    if isinstance(urls, str):
+        urls = [urls]
+    if not isinstance(urls, (list, tuple)) or not all(isinstance(url, str) for url in urls):
+        logging.error(f"Invalid URLs passed to fetch_urls function: {urls!r}")
+        return "Error: 'urls' must be a list of URL strings."
+    if not urls:
+        logging.error("No URLs provided to fetch_urls function.")
+        return "Error: No URLs provided."
+
+    logging.info(f"Fetching {len(urls)} URLs.")
+    results = get_page_fetcher().fetch_many(urls, token_budget=token_budget)
+    pages = "\n\n".join(f"=== {url} ===\n{text}" for url, text in results)
+    failed = sum(1 for _, text in results if text.strip().lower().startswith(ERROR_PREFIXES))
+    if failed:
+        return f"Error: {failed} of {len(results)} pages could not be fetched.\n\n{pages}"
+    return pages
@@ -2,6 +2,7 @@
 
 import logging
 from control_system import ControlSystem
+from notification import get_event_bus
 
 def main():
     # Configure logging once
@@ -19,6 +20,8 @@ def main():
         return
     control_system = ControlSystem(goal)
     control_system.run()
+    # Deliver pending events, including the completion sound, before exiting
+    get_event_bus().close()
     print("All subtasks have been completed. Check 'progress.log' for details.")
 
 if __name__ == "__main__":
@@ -0,0 +1,370 @@
+# memory.py
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl  # Inter-process lock of the index directory
+except ImportError:
+    fcntl = None
+
+from config import MEMORY_DIR, MEMORY_EMBEDDING_DIM, MEMORY_TOP_K, MEMORY_TOKEN_BUDGET
+
+# Results starting with one of these prefixes are treated as failed actions
+ERROR_PREFIXES = ("error", "an error occurred", "an unexpected error occurred", "skipped")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimates the number of tokens in a text (about 4 characters per token).
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return max(1, len(text) // 4)
+
+class HashingEmbedder:
+    """
+    Local embedder that maps text to a fixed-size vector by hashing words and word pairs.
+    Needs no model download or API call, so it is always available.
+    """
+
+    def __init__(self, dim: int = MEMORY_EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts) -> np.ndarray:
+        """
+        Embeds a list of texts.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: L2-normalised float32 array of shape (len(texts), dim).
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+            norm = np.linalg.norm(vectors[row])
+            if norm > 0:
+                vectors[row] /= norm
+        return vectors
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by the OpenAI embeddings endpoint.
+    """
+
+    def __init__(self, client, model: str = "text-embedding-3-small", dim: int = 1536):
+        self.client = client
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts) -> np.ndarray:
+        """
+        Embeds a list of texts with the OpenAI API.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: L2-normalised float32 array of shape (len(texts), dim).
+        """
+        response = self.client.embeddings.create(model=self.model, input=list(texts), dimensions=self.dim)
+        vectors = np.array([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class VectorIndex:
+    """
+    Append-only vector index stored as a memory-mapped float32 matrix on disk,
+    with one JSON metadata record per row.
+
+    Several processes may share an index directory: appends hold an exclusive lock on
+    `index.lock` and place new rows after the records already on disk, and every read
+    picks up rows appended by other processes. (The lock needs fcntl; on platforms
+    without it, only threads of a single process are synchronised.)
+    """
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, directory: str, dim: int):
+        """
+        Opens (or creates) the index stored in the given directory.
+
+        Args:
+            directory (str): Directory holding the index files.
+            dim (int): Dimension of the stored vectors.
+        """
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.records_path = os.path.join(directory, "records.jsonl")
+        self.header_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "index.lock")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.records = []
+        self._rows_by_kind = {}
+        self._records_offset = 0
+        self._vectors = None
+        self._vectors_size = None
+        self.capacity = 0
+
+        with self._lock, self._file_lock(exclusive=True):
+            if os.path.exists(self.header_path):
+                with open(self.header_path, "r", encoding="utf-8") as f:
+                    stored_dim = json.load(f)["dim"]
+                if stored_dim != dim:
+                    raise ValueError(
+                        f"Memory index at {directory} has dimension {stored_dim}, but the embedder produces {dim}."
+                    )
+            else:
+                with open(self.header_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": dim}, f)
+
+            if not os.path.exists(self.vectors_path):
+                self._resize(self.INITIAL_CAPACITY)
+            self._sync()
+
+    def __len__(self):
+        with self._lock, self._file_lock(exclusive=False):
+            self._sync()
+            return len(self.records)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Holds the inter-process lock of the index directory."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """
+        Picks up vectors and records appended by other processes since the last call.
+        Must be called with both locks held.
+        """
+        size = os.path.getsize(self.vectors_path)
+        if size != self._vectors_size:
+            self._open()
+
+        if os.path.exists(self.records_path) and os.path.getsize(self.records_path) != self._records_offset:
+            with open(self.records_path, "rb") as f:
+                f.seek(self._records_offset)
+                data = f.read()
+            # Only consume complete lines; a partial line belongs to an append still in progress
+            complete = data[:data.rfind(b"\n") + 1]
+            self._add_records([json.loads(line) for line in complete.decode("utf-8").splitlines() if line.strip()])
+            self._records_offset += len(complete)
+
+        # Rows past the last complete record belong to an interrupted append
+        if len(self.records) > self.capacity:
+            logging.warning("Memory index has more records than vectors. Truncating records.")
+            records = self.records[:self.capacity]
+            self.records, self._rows_by_kind = [], {}
+            self._add_records(records)
+
+    def _add_records(self, records):
+        """Adds records after the existing ones and indexes their rows by kind. Must be called with the lock held."""
+        for row, record in enumerate(records, start=len(self.records)):
+            self._rows_by_kind.setdefault(record.get("kind"), []).append(row)
+        self.records.extend(records)
+
+    def _open(self):
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._vectors_size = os.path.getsize(self.vectors_path)
+        self.capacity = self._vectors_size // (self.dim * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _resize(self, capacity: int):
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+
+    def append(self, vectors: np.ndarray, records):
+        """
+        Appends vectors and their metadata records to the index.
+
+        Args:
+            vectors (np.ndarray): Array of shape (n, dim).
+            records (list[dict]): One JSON-serialisable record per vector.
+        """
+        if len(vectors) != len(records):
+            raise ValueError("Number of vectors and records must match.")
+        if not len(records):
+            return
+
+        with self._lock, self._file_lock(exclusive=True):
+            self._sync()
+            start = len(self.records)
+            end = start + len(records)
+            if end > self.capacity:
+                self._resize(max(self.capacity * 2, end))
+                self._open()
+
+            # Vectors are written before their records, so a reader never sees a record without its vector
+            self._vectors[start:end] = vectors
+            self._vectors.flush()
+            with open(self.records_path, "ab") as f:
+                f.seek(self._records_offset)
+                f.truncate()
+                data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+                f.write(data)
+            self._records_offset += len(data)
+            self._add_records(records)
+
+    def search(self, query: np.ndarray, k: int, kinds=None):
+        """
+        Finds the stored vectors most similar to the query (cosine similarity).
+
+        Args:
+            query (np.ndarray): Normalised query vector of shape (dim,).
+            k (int): Maximum number of results.
+            kinds (tuple[str], optional): Only search records of these kinds.
+
+        Returns:
+            list[tuple[float, dict]]: (score, record) pairs, best first.
+        """
+        with self._lock:
+            with self._file_lock(exclusive=False):
+                self._sync()
+            if kinds:
+                rows = np.array(sorted(row for kind in set(kinds) for row in self._rows_by_kind.get(kind, [])),
+                                dtype=np.int64)
+                vectors = self._vectors[rows] if len(rows) else None
+            else:
+                rows = np.arange(len(self.records))
+                vectors = self._vectors[:len(rows)]
+            if len(rows) == 0 or k <= 0:
+                return []
+            scores = np.asarray(vectors @ query)
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self.records[rows[i]]) for i in top]
+
+class LongTermMemory:
+    """
+    Persistent memory of past goals, plans, and successful actions, shared across ControlSystem runs.
+    """
+
+    def __init__(self, directory: str = MEMORY_DIR, embedder=None):
+        """
+        Initializes the memory store.
+
+        Args:
+            directory (str): Directory where the index is persisted.
+            embedder: Object with a `dim` attribute and an `embed(texts)` method.
+                Defaults to the local HashingEmbedder.
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.index = VectorIndex(directory, self.embedder.dim)
+        logging.info(f"LongTermMemory loaded with {len(self.index)} entries from {directory}.")
+
+    def remember(self, entries):
+        """
+        Embeds and stores a batch of memories.
+
+        Args:
+            entries (list[dict]): Records with at least "kind" and "text" keys.
+        """
+        if not entries:
+            return
+        vectors = self.embedder.embed([entry["text"] for entry in entries])
+        timestamp = time.time()
+        records = [dict(entry, created_at=timestamp) for entry in entries]
+        self.index.append(vectors, records)
+
+    def record_run(self, goal: str, plan: str, execution_history, max_result_chars: int = 2000):
+        """
+        Stores the plan and the successful action/result pairs of a finished run.
+
+        Args:
+            goal (str): The goal of the run.
+            plan (str): The plan that was followed.
+            execution_history (list[dict]): Entries with "action" and "result" keys.
+            max_result_chars (int): Results are truncated to this length before storing.
+        """
+        entries = []
+        if plan:
+            entries.append({"kind": "plan", "goal": goal, "text": f"Goal: {goal}\nPlan: {plan}"})
+        for entry in execution_history:
+            result = str(entry["result"]).strip()
+            if not result or result.lower().startswith(ERROR_PREFIXES):
+                continue
+            entries.append({
+                "kind": "action",
+                "goal": goal,
+                "text": f"Action: {entry['action']}\nResult: {result[:max_result_chars]}"
+            })
+        self.remember(entries)
+        logging.info(f"Stored {len(entries)} memories for goal: {goal}")
+
+    def recall(self, query: str, kinds=None, k: int = MEMORY_TOP_K, token_budget: int = MEMORY_TOKEN_BUDGET):
+        """
+        Retrieves the memories most relevant to the query that fit in the token budget.
+
+        Args:
+            query (str): Text to search for.
+            kinds (tuple[str], optional): Only return memories of these kinds.
+            k (int): Maximum number of memories to return.
+            token_budget (int): Approximate total token budget of the returned texts.
+
+        Returns:
+            list[dict]: The recalled memory records, most relevant first.
+        """
+        if len(self.index) == 0:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        candidates = self.index.search(query_vector, k, kinds=kinds)
+
+        recalled = []
+        used_tokens = 0
+        for score, record in candidates:
+            if score <= 0:
+                break
+            tokens = estimate_tokens(record["text"])
+            if used_tokens + tokens > token_budget:
+                continue
+            recalled.append(record)
+            used_tokens += tokens
+            if len(recalled) >= k:
+                break
+        return recalled
+
+    @staticmethod
+    def format_memories(records) -> str:
+        """
+        Formats recalled memories for inclusion in a prompt.
+
+        Args:
+            records (list[dict]): Records returned by `recall`.
+
+        Returns:
+            str: The formatted memories, or an empty string if there are none.
+        """
+        return "\n\n".join(record["text"] for record in records)
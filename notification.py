@@ -1,18 +1,266 @@
 # notification.py
 
-from preferredsoundplayer import playsound
-import threading
+import json
+import logging
 import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+import httpx
+from preferredsoundplayer import playsound
+
+from config import (
+    NOTIFICATION_SOUND_PATH, EVENT_QUEUE_SIZE, EVENT_SOUND, EVENT_STDOUT,
+    EVENT_LOG_PATH, EVENT_WEBHOOK_URL, EVENT_WEBHOOK_TIMEOUT
+)
+
+try:
+    import winsound  # Plays a sound from an in-memory buffer on Windows
+except ImportError:
+    winsound = None
+
+# Event types published by ControlSystem
+PHASE_START = "phase_start"
+PHASE_END = "phase_end"
+PLAN = "plan"
+STEP = "step"
+STOPPED = "stopped"
+TOOL_ERROR = "tool_error"
+EVALUATION = "evaluation"
+SUMMARY = "summary"
+RUN_COMPLETE = "run_complete"
+
+class Event:
+    """
+    A progress event of a run.
+    """
+
+    def __init__(self, type: str, run_id: str = None, **data):
+        """
+        Args:
+            type (str): The event type, e.g. PHASE_START or RUN_COMPLETE.
+            run_id (str, optional): Identifies the run that published the event.
+            **data: Details of the event.
+        """
+        self.type = type
+        self.run_id = run_id
+        self.data = data
+        self.timestamp = time.time()
+
+    def to_dict(self) -> dict:
+        return {"type": self.type, "run_id": self.run_id, "timestamp": self.timestamp, "data": self.data}
+
+    def __repr__(self):
+        return f"Event({self.type!r}, run_id={self.run_id!r}, data={self.data!r})"
+
+class SoundSink:
+    """
+    Plays the notification sound when a run completes. The sound file is read once; several runs
+    completing in the same burst produce a single sound.
+
+    Windows plays the cached bytes directly. Other platforms need a file, so the cached bytes are
+    written once to a temporary copy that stays in place however often the original changes.
+    """
+
+    def __init__(self, sound_path: str = NOTIFICATION_SOUND_PATH):
+        self.sound_path = sound_path
+        self.sound_data = None
+        self._temp_path = None
+        if os.path.exists(sound_path):
+            with open(sound_path, "rb") as f:
+                self.sound_data = f.read()
+        else:
+            print(f"Notification sound file '{sound_path}' not found.")
+
+    def handle(self, events):
+        if self.sound_data is None or not any(event.type == RUN_COMPLETE for event in events):
+            return
+        if winsound is not None:
+            winsound.PlaySound(self.sound_data, winsound.SND_MEMORY)
+            return
+        if self._temp_path is None:
+            with tempfile.NamedTemporaryFile(prefix="notification_", suffix=".wav", delete=False) as f:
+                f.write(self.sound_data)
+            self._temp_path = f.name
+        playsound(self._temp_path)
+
+    def close(self):
+        if self._temp_path is not None:
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+            self._temp_path = None
+
+class StdoutSink:
+    """
+    Prints one line per event.
+    """
+
+    def handle(self, events):
+        lines = []
+        for event in events:
+            details = ", ".join(f"{key}={value}" for key, value in event.data.items() if key != "subtasks")
+            prefix = f"[{event.run_id}] " if event.run_id else ""
+            lines.append(f"{prefix}{event.type}: {details}"[:500])
+        print("\n".join(lines), flush=True)
+
+class JsonlFileSink:
+    """
+    Appends events to a JSON Lines file.
+    """
+
+    def __init__(self, path: str = EVENT_LOG_PATH):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def handle(self, events):
+        self._file.write("".join(json.dumps(event.to_dict(), default=str) + "\n" for event in events))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class WebhookSink:
+    """
+    Posts events as a JSON array to a webhook, one request per burst of events.
+    """
+
+    def __init__(self, url: str = EVENT_WEBHOOK_URL, timeout: float = EVENT_WEBHOOK_TIMEOUT):
+        self.url = url
+        self.client = httpx.Client(timeout=timeout)
+
+    def handle(self, events):
+        response = self.client.post(self.url, json=[event.to_dict() for event in events])
+        response.raise_for_status()
+
+    def close(self):
+        self.client.close()
+
+class _SinkWorker:
+    """
+    Delivers events to one sink on its own thread, so that a slow sink (e.g. playing a sound or
+    posting to a webhook) does not hold up the others. Events that arrive while the sink is busy
+    are delivered together in the next call.
+    """
+
+    def __init__(self, sink, max_queue_size: int):
+        self.sink = sink
+        self.dropped = 0
+        self._queue = deque(maxlen=max_queue_size)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"event-sink-{type(sink).__name__}", daemon=True)
+        self._thread.start()
+
+    def put(self, event: Event):
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(event)
+            self._condition.notify()
+
+    def close(self, timeout: float = None):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue and self._closed:
+                    return
+                events = list(self._queue)
+                self._queue.clear()
+            try:
+                self.sink.handle(events)
+            except Exception:
+                logging.exception(f"Event sink {type(self.sink).__name__} failed.")
+
+class EventBus:
+    """
+    In-process event bus. Publishing only appends to bounded queues and never blocks. Each sink
+    has its own delivery thread that passes it the queued events in batches, so a burst of events
+    from many concurrent runs reaches each sink as one call, and a slow sink does not delay the others.
+    """
+
+    def __init__(self, sinks=None, max_queue_size: int = EVENT_QUEUE_SIZE):
+        """
+        Initializes the bus and starts a delivery thread per sink.
+
+        Args:
+            sinks (list, optional): Objects with a `handle(events)` method (and optionally `close()`).
+            max_queue_size (int): Maximum number of undelivered events per sink. When full, the oldest are dropped.
+        """
+        self.sinks = list(sinks or [])
+        self._workers = [_SinkWorker(sink, max_queue_size) for sink in self.sinks]
+
+    @property
+    def dropped(self) -> int:
+        """Number of events dropped because a sink fell too far behind."""
+        return sum(worker.dropped for worker in self._workers)
+
+    def publish(self, event: Event):
+        """
+        Queues an event for delivery.
+
+        Args:
+            event (Event): The event to publish.
+        """
+        for worker in self._workers:
+            worker.put(event)
+
+    def close(self, timeout: float = None):
+        """
+        Delivers the remaining events, stops the delivery threads, and closes the sinks.
+
+        Args:
+            timeout (float, optional): Maximum time to wait for each sink's delivery, in seconds.
+        """
+        for worker in self._workers:
+            worker.close(timeout)
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+def create_sinks(sound: bool = EVENT_SOUND, stdout: bool = EVENT_STDOUT, log_path: str = EVENT_LOG_PATH,
+                 webhook_url: str = EVENT_WEBHOOK_URL):
+    """
+    Creates the sinks enabled in the configuration.
+
+    Args:
+        sound (bool): Play the notification sound when a run completes.
+        stdout (bool): Print every event.
+        log_path (str, optional): Append events to this JSON Lines file.
+        webhook_url (str, optional): Post events to this URL.
 
-from config import NOTIFICATION_SOUND_PATH
+    Returns:
+        list: The sinks.
+    """
+    sinks = []
+    if sound:
+        sinks.append(SoundSink())
+    if stdout:
+        sinks.append(StdoutSink())
+    if log_path:
+        sinks.append(JsonlFileSink(log_path))
+    if webhook_url:
+        sinks.append(WebhookSink(webhook_url))
+    return sinks
 
-def play_sound():
-    """Play the notification sound."""
-    if os.path.exists(NOTIFICATION_SOUND_PATH):
-        playsound(NOTIFICATION_SOUND_PATH)
-    else:
-        print(f"Notification sound file '{NOTIFICATION_SOUND_PATH}' not found.")
+_event_bus = None
+_event_bus_lock = threading.Lock()
 
-def send_notification():
-    """Trigger the notification sound."""
-    threading.Thread(target=play_sound).start()
+def get_event_bus() -> EventBus:
+    """
+    Returns the process-wide EventBus with the configured sinks, creating it on first use.
+    """
+    global _event_bus
+    with _event_bus_lock:
+        if _event_bus is None:
+            _event_bus = EventBus(create_sinks())
+        return _event_bus
@@ -0,0 +1,159 @@
+# plan_scheduler.py
+
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import PLAN_MAX_WORKERS
+
+def parse_plan(text: str):
+    """
+    Parses a JSON plan into a list of subtasks and validates its dependency graph.
+
+    The expected format is:
+        {"subtasks": [{"id": "1", "description": "...", "depends_on": []}, ...]}
+
+    Args:
+        text (str): The plan returned by GPT, optionally wrapped in a Markdown code block.
+
+    Returns:
+        list[dict]: Subtasks with "id", "description", and "depends_on" keys.
+
+    Raises:
+        ValueError: If the plan is not valid JSON, references unknown subtasks, or contains a cycle.
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("No JSON object found in plan.")
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Plan is not valid JSON: {e}")
+
+    raw_subtasks = data.get("subtasks") if isinstance(data, dict) else None
+    if not raw_subtasks or not isinstance(raw_subtasks, list):
+        raise ValueError("Plan does not contain any subtasks.")
+
+    subtasks = []
+    ids = set()
+    for raw in raw_subtasks:
+        if not isinstance(raw, dict) or not raw.get("description"):
+            raise ValueError(f"Invalid subtask: {raw}")
+        subtask_id = str(raw.get("id", len(subtasks) + 1))
+        if subtask_id in ids:
+            raise ValueError(f"Duplicate subtask id: {subtask_id}")
+        ids.add(subtask_id)
+        subtasks.append({
+            "id": subtask_id,
+            "description": str(raw["description"]),
+            "depends_on": [str(dep) for dep in raw.get("depends_on") or []]
+        })
+
+    for subtask in subtasks:
+        unknown = [dep for dep in subtask["depends_on"] if dep not in ids]
+        if unknown:
+            raise ValueError(f"Subtask {subtask['id']} depends on unknown subtasks: {unknown}")
+
+    # Kahn's algorithm: every subtask must be reachable without going through a cycle
+    remaining = {subtask["id"]: set(subtask["depends_on"]) for subtask in subtasks}
+    while remaining:
+        ready = [subtask_id for subtask_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"Plan contains a dependency cycle among subtasks: {sorted(remaining)}")
+        for subtask_id in ready:
+            del remaining[subtask_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    return subtasks
+
+def format_plan(subtasks) -> str:
+    """
+    Formats subtasks as a readable numbered plan.
+
+    Args:
+        subtasks (list[dict]): Subtasks as returned by `parse_plan`.
+
+    Returns:
+        str: One line per subtask, including its dependencies.
+    """
+    lines = []
+    for subtask in subtasks:
+        line = f"{subtask['id']}. {subtask['description']}"
+        if subtask["depends_on"]:
+            line += f" (after {', '.join(subtask['depends_on'])})"
+        lines.append(line)
+    return "\n".join(lines)
+
+class PlanScheduler:
+    """
+    Runs the subtasks of a plan in dependency order, executing independent subtasks in parallel.
+    """
+
+    def __init__(self, subtasks, max_workers: int = PLAN_MAX_WORKERS):
+        """
+        Initializes the scheduler.
+
+        Args:
+            subtasks (list[dict]): Subtasks as returned by `parse_plan`.
+            max_workers (int): Maximum number of subtasks running at the same time.
+        """
+        self.subtasks = {subtask["id"]: subtask for subtask in subtasks}
+        self.order = [subtask["id"] for subtask in subtasks]
+        self.max_workers = max_workers
+
+    def run(self, worker):
+        """
+        Executes all subtasks.
+
+        A subtask is started as soon as all of its dependencies have finished. If a dependency
+        fails, its dependents are skipped.
+
+        Args:
+            worker (callable): Called as `worker(subtask, dependency_results)` where
+                `dependency_results` maps dependency ids to their results. Its return value is
+                stored as the subtask's result.
+
+        Returns:
+            dict: Maps subtask id to {"status": "done" | "failed" | "skipped", "result": ...},
+                in plan order.
+        """
+        outcomes = {}
+        pending = list(self.order)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for subtask_id in list(pending):
+                    deps = self.subtasks[subtask_id]["depends_on"]
+                    if any(dep not in outcomes for dep in deps):
+                        continue
+                    pending.remove(subtask_id)
+                    failed = [dep for dep in deps if outcomes[dep]["status"] != "done"]
+                    if failed:
+                        logging.warning(f"Skipping subtask {subtask_id}: dependencies {failed} did not complete.")
+                        outcomes[subtask_id] = {
+                            "status": "skipped",
+                            "result": f"Skipped because dependencies {', '.join(failed)} did not complete."
+                        }
+                        continue
+                    dependency_results = {dep: outcomes[dep]["result"] for dep in deps}
+                    logging.info(f"Starting subtask {subtask_id}: {self.subtasks[subtask_id]['description']}")
+                    future = executor.submit(worker, self.subtasks[subtask_id], dependency_results)
+                    running[future] = subtask_id
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subtask_id = running.pop(future)
+                    try:
+                        outcomes[subtask_id] = {"status": "done", "result": future.result()}
+                        logging.info(f"Subtask {subtask_id} completed.")
+                    except Exception as e:
+                        logging.exception(f"Subtask {subtask_id} failed.")
+                        outcomes[subtask_id] = {"status": "failed", "result": f"An error occurred: {e}"}
+
+        return {subtask_id: outcomes[subtask_id] for subtask_id in self.order}
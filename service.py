@@ -0,0 +1,431 @@
+# service.py
+
+import argparse
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import (
+    SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS, SERVICE_DB_PATH, SERVICE_EVENT_RETENTION, SERVICE_CANCEL_POLL_INTERVAL
+)
+from control_system import ControlSystem, RunCancelled
+from gpt_integration import GPTIntegration
+from memory import LongTermMemory
+from notification import EventBus, create_sinks
+
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+class JobStore:
+    """
+    Persists jobs in a SQLite database so that queued goals survive a restart.
+    """
+
+    def __init__(self, db_path: str = SERVICE_DB_PATH):
+        """
+        Opens (or creates) the job database.
+
+        Args:
+            db_path (str): Path to the SQLite database file.
+        """
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, goal TEXT NOT NULL, status TEXT NOT NULL, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "plan TEXT, evaluation TEXT, error TEXT)"
+            )
+
+    def create(self, goal: str) -> dict:
+        """
+        Adds a new queued job.
+
+        Args:
+            goal (str): The goal to achieve.
+
+        Returns:
+            dict: The created job.
+        """
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, goal, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, goal, now, now)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        """
+        Looks up a job.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The job, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def update(self, job_id: str, **fields):
+        """
+        Updates columns of a job.
+
+        Args:
+            job_id (str): The job id.
+            **fields: Column values to set.
+        """
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def unfinished(self):
+        """
+        Returns the ids of jobs that were queued or running, oldest first.
+
+        Returns:
+            list[str]: The job ids.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+class JobManager:
+    """
+    Runs queued jobs that share one GPT client and long-term memory, with at most `workers` jobs
+    executing at the same time.
+
+    Each job runs in its own thread. A job gives up its slot while it waits for a batched request,
+    so with batching enabled many queued goals can put their requests into the same batch.
+    """
+
+    def __init__(self, store: JobStore, workers: int = SERVICE_WORKERS, gpt: GPTIntegration = None,
+                 memory: LongTermMemory = None, event_bus: EventBus = None,
+                 event_retention: float = SERVICE_EVENT_RETENTION):
+        """
+        Initializes the manager and requeues jobs left unfinished by a previous process.
+
+        Args:
+            store (JobStore): Persistent job storage.
+            workers (int): Number of jobs executed at the same time. Jobs waiting for a batched request
+                do not count.
+            gpt (GPTIntegration, optional): Shared GPT client.
+            memory (LongTermMemory, optional): Shared long-term memory.
+            event_bus (EventBus, optional): Bus shared by all jobs. Defaults to the configured sinks
+                without the notification sound.
+            event_retention (float): Seconds the progress events of a finished job are kept in memory
+                for late event-stream clients. Afterwards only the stored status is reported.
+        """
+        self.store = store
+        self.gpt = gpt if gpt is not None else GPTIntegration()
+        self.memory = memory if memory is not None else LongTermMemory()
+        self.event_bus = event_bus if event_bus is not None else EventBus(create_sinks(sound=False))
+        self._queue = queue.Queue()
+        self.event_retention = event_retention
+        self._events = {}
+        self._event_expiry = {}
+        self._cancel_events = {}
+        self._condition = threading.Condition()
+        self._slots = threading.Semaphore(workers)
+
+        for job_id in store.unfinished():
+            logging.info(f"Requeueing unfinished job {job_id}.")
+            store.update(job_id, status="queued")
+            self._queue.put(job_id)
+
+        self._dispatcher = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, goal: str) -> dict:
+        """
+        Queues a new goal.
+
+        Args:
+            goal (str): The goal to achieve.
+
+        Returns:
+            dict: The created job.
+        """
+        job = self.store.create(goal)
+        self._publish(job["id"], "status", {"status": "queued"})
+        self._queue.put(job["id"])
+        logging.info(f"Job {job['id']} queued with goal: {goal}")
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Requests cancellation of a job. Queued jobs are cancelled immediately;
+        running jobs stop at their next step.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            bool: False if the job does not exist or has already finished.
+        """
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINAL_STATUSES:
+            return False
+        with self._condition:
+            self._cancel_events.setdefault(job_id, threading.Event()).set()
+        if job["status"] == "queued":
+            self._finish(job_id, "cancelled")
+        logging.info(f"Cancellation requested for job {job_id}.")
+        return True
+
+    def events_since(self, job_id: str, index: int, timeout: float):
+        """
+        Waits for progress events of a job.
+
+        Args:
+            job_id (str): The job id.
+            index (int): Number of events the caller has already seen.
+            timeout (float): Maximum time to wait for a new event, in seconds.
+
+        Returns:
+            list[dict]: Events after `index`; empty if none arrived within the timeout.
+        """
+        with self._condition:
+            self._prune_events(time.time())
+            self._condition.wait_for(lambda: len(self._events.get(job_id, [])) > index, timeout=timeout)
+            return list(self._events.get(job_id, [])[index:])
+
+    def _publish(self, job_id: str, event: str, data: dict):
+        now = time.time()
+        with self._condition:
+            self._events.setdefault(job_id, []).append({"event": event, "data": data, "time": now})
+            if event == "status" and data["status"] in FINAL_STATUSES:
+                self._event_expiry[job_id] = now + self.event_retention
+            self._prune_events(now)
+            self._condition.notify_all()
+
+    def _prune_events(self, now: float):
+        """Drops the events of jobs that finished over `event_retention` seconds ago. Must be called with the lock held."""
+        for job_id, expiry in list(self._event_expiry.items()):
+            if expiry <= now:
+                del self._event_expiry[job_id]
+                self._events.pop(job_id, None)
+
+    def _finish(self, job_id: str, status: str, **fields):
+        self.store.update(job_id, status=status, **fields)
+        self._publish(job_id, "status", {"status": status})
+
+    def _dispatch(self):
+        while True:
+            job_id = self._queue.get()
+            self._slots.acquire()
+            threading.Thread(target=self._worker, args=(job_id,), name=f"job-{job_id[:8]}", daemon=True).start()
+
+    def _worker(self, job_id: str):
+        try:
+            self._run_job(job_id)
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed.")
+            self._finish(job_id, "failed", error=str(e))
+        finally:
+            with self._condition:
+                self._cancel_events.pop(job_id, None)
+            self._slots.release()
+            self._queue.task_done()
+
+    def _wait_deferred(self, future, cancel_event: threading.Event):
+        """
+        Waits for a batched request without holding a worker slot.
+        Raises RunCancelled as soon as the job is cancelled instead of waiting for the batch.
+        """
+        self._slots.release()
+        try:
+            while True:
+                if cancel_event.is_set():
+                    raise RunCancelled()
+                try:
+                    return future.result(timeout=SERVICE_CANCEL_POLL_INTERVAL)
+                except FutureTimeoutError:
+                    continue
+        finally:
+            self._slots.acquire()
+
+    def _run_job(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] != "queued":
+            return
+        with self._condition:
+            cancel_event = self._cancel_events.setdefault(job_id, threading.Event())
+
+        self.store.update(job_id, status="running")
+        self._publish(job_id, "status", {"status": "running"})
+
+        control_system = ControlSystem(
+            job["goal"],
+            memory=self.memory,
+            gpt=self.gpt,
+            on_progress=lambda event, data: self._publish(job_id, event, data),
+            cancel_event=cancel_event,
+            event_bus=self.event_bus,
+            defer_planning=True,
+            run_id=job_id,
+            wait_deferred=lambda future: self._wait_deferred(future, cancel_event)
+        )
+        control_system.run()
+        self._finish(
+            job_id,
+            control_system.status,
+            plan=control_system.plan,
+            evaluation=control_system.evaluation,
+            error="See 'progress.log' for details." if control_system.status == "failed" else None
+        )
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON API:
+        POST /jobs                {"goal": "..."}  Submit a goal.
+        GET  /jobs/<id>                            Get the status of a job.
+        GET  /jobs/<id>/events                     Stream progress as server-sent events.
+        POST /jobs/<id>/cancel                     Cancel a job.
+    """
+
+    manager: JobManager = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path == "/jobs":
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                goal = str(body.get("goal", "")).strip()
+            except (ValueError, AttributeError):
+                return self._send_json(400, {"error": "Request body must be a JSON object."})
+            if not goal:
+                return self._send_json(400, {"error": "No goal provided."})
+            return self._send_json(202, self.manager.submit(goal))
+
+        match = re.fullmatch(r"/jobs/(\w+)/cancel", self.path)
+        if match:
+            job_id = match.group(1)
+            if self.manager.store.get(job_id) is None:
+                return self._send_json(404, {"error": "Job not found."})
+            if not self.manager.cancel(job_id):
+                return self._send_json(409, {"error": "Job has already finished."})
+            return self._send_json(202, self.manager.store.get(job_id))
+
+        self._send_json(404, {"error": "Not found."})
+
+    def do_GET(self):
+        match = re.fullmatch(r"/jobs/(\w+)(/events)?", self.path)
+        if not match:
+            return self._send_json(404, {"error": "Not found."})
+        job = self.manager.store.get(match.group(1))
+        if job is None:
+            return self._send_json(404, {"error": "Job not found."})
+        if match.group(2):
+            return self._stream_events(job)
+        self._send_json(200, job)
+
+    def _stream_events(self, job: dict):
+        job_id = job["id"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            index = int(self.headers.get("Last-Event-ID", -1)) + 1
+        except ValueError:
+            index = 0
+        try:
+            # Events are kept in memory only, and only for a while after the job finished;
+            # after that (or after a restart), report the stored status
+            if job["status"] in FINAL_STATUSES and not self.manager.events_since(job_id, 0, timeout=0):
+                self._write_event(0, "status", {"status": job["status"]})
+                return
+            while True:
+                events = self.manager.events_since(job_id, index, timeout=15)
+                if not events:
+                    # Keep idle connections alive
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    continue
+                for event in events:
+                    self._write_event(index, event["event"], event["data"])
+                    index += 1
+                    if event["event"] == "status" and event["data"]["status"] in FINAL_STATUSES:
+                        return
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info(f"Event stream for job {job_id} closed by client.")
+
+    def _write_event(self, index: int, event: str, data: dict):
+        payload = f"id: {index}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        self.wfile.write(payload.encode("utf-8"))
+        self.wfile.flush()
+
+def serve(host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = SERVICE_WORKERS,
+          db_path: str = SERVICE_DB_PATH, batch: bool = False):
+    """
+    Starts the HTTP service and blocks until interrupted.
+
+    Args:
+        host (str): Interface to bind to.
+        port (int): Port to listen on.
+        workers (int): Number of goals executed at the same time.
+        db_path (str): Path to the persistent job database.
+        batch (bool): Send planning and evaluation requests of queued goals through the Batch API.
+    """
+    gpt = GPTIntegration(use_batch=batch)
+    ServiceHandler.manager = JobManager(JobStore(db_path), workers=workers, gpt=gpt)
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    print(f"Service listening on http://{host}:{port}")
+    logging.info(f"Service listening on http://{host}:{port} with {workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    logging.basicConfig(
+        filename='progress.log',
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(threadName)s - %(module)s - %(funcName)s - line %(lineno)d: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    parser = argparse.ArgumentParser(description="Run the goal manager as a local HTTP service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--db", default=SERVICE_DB_PATH)
+    parser.add_argument("--batch", action="store_true",
+                        help="Send planning and evaluation through the Batch API at lower cost and higher latency.")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.db, args.batch)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# step_controller.py
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    GPT_PRICING, BATCH_PRICE_FACTOR, RUN_TOKEN_BUDGET, RUN_COST_BUDGET, RUN_TIME_BUDGET,
+    MAX_REPEATED_ACTIONS, MAX_REPEATED_ERRORS, MAX_CYCLE_LENGTH
+)
+from memory import ERROR_PREFIXES
+
+# Parts of a result that change on every run of the same action: the resource usage line appended by
+# tool_execute_code_file, timestamps, clock times, and durations
+VOLATILE_PATTERNS = [
+    re.compile(r"\[resource usage:[^\]]*\]"),
+    re.compile(r"\b\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(z|[+-]\d{2}:?\d{2})?"),
+    re.compile(r"\b\d{1,2}:\d{2}:\d{2}(\.\d+)?\b"),
+    re.compile(r"\b\d+(\.\d+)?\s*(ms|milliseconds?|s|secs?|seconds?)\b"),
+]
+
+def fingerprint(text: str) -> str:
+    """
+    Computes a fingerprint of a text that ignores case, whitespace, and volatile parts such as
+    timestamps and durations. Other numbers are kept, so "page 1" and "page 2" differ.
+
+    Args:
+        text (str): The text to fingerprint.
+
+    Returns:
+        str: A short hex digest.
+    """
+    normalized = str(text).lower()
+    for pattern in VOLATILE_PATTERNS:
+        normalized = pattern.sub("#", normalized)
+    normalized = " ".join(normalized.split())
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+class StepController:
+    """
+    Tracks the progress and resource usage of a run and decides when execution should stop.
+
+    Stops are triggered by exhausted token, cost, or wall-clock budgets (for the whole run), or by a
+    subtask that repeats the same action with the same result, keeps getting the same error, or cycles
+    through the same action/result pairs without making progress.
+    """
+
+    def __init__(self, token_budget: int = RUN_TOKEN_BUDGET, cost_budget: float = RUN_COST_BUDGET,
+                 time_budget: float = RUN_TIME_BUDGET):
+        """
+        Initializes the controller. The wall-clock budget starts counting immediately, except while paused.
+
+        Args:
+            token_budget (int): Maximum total tokens (prompt and completion) for the run.
+            cost_budget (float): Maximum estimated cost in USD for the run.
+            time_budget (float): Maximum wall-clock time in seconds for the run.
+        """
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.time_budget = time_budget
+        self.started_at = time.monotonic()
+        self._paused_time = 0.0
+        self._paused_since = None
+        self._pause_depth = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.api_calls = 0
+        self.batch_calls = 0
+        self.steps = 0
+        self.stop_reasons = {}
+        self._history = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def elapsed(self) -> float:
+        """Wall-clock time of the run, excluding time spent in `paused()`."""
+        now = time.monotonic()
+        paused = self._paused_time
+        if self._paused_since is not None:
+            paused += now - self._paused_since
+        return now - self.started_at - paused
+
+    @contextmanager
+    def paused(self):
+        """
+        Stops the wall-clock budget while the block runs, e.g. while waiting for a batched request
+        whose latency is not spent on the run's own work.
+        """
+        with self._lock:
+            if self._pause_depth == 0:
+                self._paused_since = time.monotonic()
+            self._pause_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pause_depth -= 1
+                if self._pause_depth == 0:
+                    self._paused_time += time.monotonic() - self._paused_since
+                    self._paused_since = None
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int, batch: bool = False):
+        """
+        Adds the token usage of one API call.
+
+        Args:
+            model (str): The model that was called.
+            prompt_tokens (int): Number of prompt tokens.
+            completion_tokens (int): Number of completion tokens.
+            batch (bool): Whether the call went through the discounted batch endpoint.
+        """
+        input_price, output_price = GPT_PRICING.get(model, (0.0, 0.0))
+        cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+        if batch:
+            cost *= BATCH_PRICE_FACTOR
+        with self._lock:
+            self.api_calls += 1
+            self.batch_calls += int(batch)
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += cost
+
+    def check_budget(self):
+        """
+        Checks the run-wide budgets.
+
+        Returns:
+            str: The reason execution must stop, or None if there is budget left.
+        """
+        with self._lock:
+            if self.total_tokens >= self.token_budget:
+                return f"Token budget exhausted ({self.total_tokens} of {self.token_budget} tokens used)."
+            if self.cost >= self.cost_budget:
+                return f"Cost budget exhausted (${self.cost:.4f} of ${self.cost_budget:.2f} spent)."
+        if self.elapsed >= self.time_budget:
+            return f"Time budget exhausted ({self.elapsed:.0f}s of {self.time_budget:.0f}s elapsed)."
+        return None
+
+    def record_step(self, subtask_id: str, action: str, result: str):
+        """
+        Records a step of a subtask and checks whether the subtask is stuck.
+
+        Args:
+            subtask_id (str): The subtask the step belongs to.
+            action (str): The action that was performed.
+            result (str): The result of the action.
+
+        Returns:
+            str: The reason the subtask must stop, or None if it is making progress.
+        """
+        action_fp = fingerprint(action)
+        result_fp = fingerprint(result)
+        is_error = str(result).strip().lower().startswith(ERROR_PREFIXES)
+
+        with self._lock:
+            self.steps += 1
+            history = self._history.setdefault(subtask_id, [])
+            history.append((action_fp, result_fp, is_error))
+
+        repeats = sum(1 for step_action, step_result, _ in history
+                      if step_action == action_fp and step_result == result_fp)
+        if repeats >= MAX_REPEATED_ACTIONS:
+            return f"The same action was repeated {repeats} times with the same result."
+
+        if is_error:
+            recent = history[-MAX_REPEATED_ERRORS:]
+            if len(recent) == MAX_REPEATED_ERRORS and all(err for _, _, err in recent):
+                return f"The last {MAX_REPEATED_ERRORS} actions all failed."
+            same_errors = sum(1 for _, fp, err in history if err and fp == result_fp)
+            if same_errors >= MAX_REPEATED_ERRORS:
+                return f"The same error occurred {same_errors} times."
+
+        # A cycle: the last `length` action/result pairs are identical to the `length` pairs before them.
+        # Repeats of a single step are left to the thresholds above.
+        steps = [(step_action, step_result) for step_action, step_result, _ in history]
+        for length in range(2, MAX_CYCLE_LENGTH + 1):
+            if len(steps) >= 2 * length and steps[-length:] == steps[-2 * length:-length]:
+                return f"No progress: the last {length} action(s) and their results repeated without change."
+        return None
+
+    def stop(self, scope: str, reason: str):
+        """
+        Records why execution stopped.
+
+        Args:
+            scope (str): What was stopped, e.g. a subtask id or "run".
+            reason (str): Why it was stopped.
+        """
+        with self._lock:
+            self.stop_reasons.setdefault(scope, reason)
+        logging.warning(f"Stopping {scope}: {reason}")
+
+    def summary(self) -> dict:
+        """
+        Summarizes the run.
+
+        Returns:
+            dict: Steps, API calls (and how many were batched), tokens, estimated cost, elapsed time, and stop reasons.
+        """
+        with self._lock:
+            return {
+                "steps": self.steps,
+                "api_calls": self.api_calls,
+                "batch_calls": self.batch_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost": round(self.cost, 6),
+                "elapsed": round(self.elapsed, 2),
+                "stop_reasons": dict(self.stop_reasons),
+            }
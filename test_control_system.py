@@ -0,0 +1,57 @@
+# test_control_system.py
+
+import time
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion
+
+from batch_processor import BatchProcessor, LocalBatchBackend
+from control_system import ControlSystem
+from gpt_integration import GPTIntegration
+from memory import LongTermMemory
+from notification import EventBus
+from step_controller import StepController
+
+def completion(text: str) -> dict:
+    return {
+        "id": "test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+
+def reply(body: dict) -> dict:
+    prompt = body["messages"][-1]["content"]
+    if "Break this goal down" in prompt:
+        return completion('{"subtasks": [{"id": "1", "description": "Write the file", "depends_on": []}]}')
+    if "next action" in prompt:
+        history = prompt.split("Execution History:")[1]
+        return completion("Plan complete" if "Action:" in history else "Write the file")
+    return completion("Done.")
+
+class SlowBatchBackend(LocalBatchBackend):
+    """A batch backend whose batches take longer than the run's time budget."""
+
+    def submit(self, input_path: str) -> str:
+        time.sleep(1.5)
+        return super().submit(input_path)
+
+def test_batched_run_executes_steps(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    gpt = GPTIntegration()
+    gpt.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **request: ChatCompletion.model_validate(reply(request))
+    )))
+    gpt.batch_processor = BatchProcessor(SlowBatchBackend(reply, str(tmp_path)), str(tmp_path),
+                                         max_wait=0.05, poll_interval=0.05)
+    control = ControlSystem("Write a file", memory=LongTermMemory(str(tmp_path / "memory")), gpt=gpt,
+                            event_bus=EventBus(), defer_planning=True)
+    # Planning and evaluation each wait 1.5 s for their batch, longer than the whole budget
+    control.controller = StepController(time_budget=1)
+
+    control.run()
+    gpt.close()
+
+    assert control.controller.steps > 0
+    assert control.execution_history
+    assert control.controller.batch_calls == 2
+    assert control.status == "completed"
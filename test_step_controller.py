@@ -0,0 +1,43 @@
+# test_step_controller.py
+
+import time
+
+from config import MAX_REPEATED_ACTIONS
+from step_controller import StepController, fingerprint
+
+def test_numbered_iteration_is_not_stopped():
+    controller = StepController()
+    for page in range(1, 6):
+        reason = controller.record_step("1", f"Fetch page {page}", f"Page {page} lists {page * 7} items.")
+        assert reason is None
+    for index in range(3):
+        reason = controller.record_step("1", f"Read notes{index}.txt", f"Contents of notes{index}.txt")
+        assert reason is None
+
+def test_repeated_action_with_same_result_is_stopped_at_threshold():
+    controller = StepController()
+    for _ in range(MAX_REPEATED_ACTIONS - 1):
+        assert controller.record_step("1", "Check status", "pending") is None
+    assert controller.record_step("1", "Check status", "pending") is not None
+
+def test_two_step_cycle_is_stopped():
+    controller = StepController()
+    steps = [("Open settings", "opened"), ("Close settings", "closed")]
+    reasons = [controller.record_step("1", action, result) for action, result in steps * 2]
+    assert reasons[:3] == [None, None, None]
+    assert reasons[3] is not None
+
+def test_fingerprint_ignores_volatile_parts():
+    first = "Code execution result:\nok\n[Resource usage: wall time 0.08s, CPU time 0.07s, peak memory 31.8 MB]"
+    second = "Code execution result:\nok\n[Resource usage: wall time 1.20s, CPU time 1.02s, peak memory 40.1 MB]"
+    assert fingerprint(first) == fingerprint(second)
+    assert fingerprint("Finished at 2024-05-01T12:00:03Z in 3.5 seconds") == \
+        fingerprint("finished at 2024-05-02T08:15:44Z in 12 seconds")
+    assert fingerprint("Fetch page 1") != fingerprint("Fetch page 2")
+
+def test_paused_time_does_not_count_against_time_budget():
+    controller = StepController(time_budget=0.2)
+    with controller.paused():
+        time.sleep(0.3)
+    assert controller.check_budget() is None
+    assert controller.elapsed < 0.2
@@ -0,0 +1,138 @@
+# tool_memo.py
+
+import json
+import logging
+import os
+import threading
+from collections import Counter
+
+from memory import ERROR_PREFIXES
+from tools import SANDBOX_DIR
+
+# Tools whose results depend only on their arguments and, for file tools, on the files they touch
+MEMOIZED_TOOLS = ("read_file", "execute_code_file", "search_internet", "fetch_urls")
+
+# Tools that change files in the sandbox
+WRITING_TOOLS = ("write_file", "delete_file")
+
+def _sandbox_path(file_path: str) -> str:
+    """Resolves a path given to a tool the same way the tools do."""
+    return os.path.realpath(os.path.join(SANDBOX_DIR, file_path))
+
+def _file_state(path: str):
+    """Returns (mtime, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+class ToolMemo:
+    """
+    Per-run memo table for idempotent tool calls.
+
+    Entries are keyed by tool name and normalized arguments. Entries of file tools record the
+    modification time and size of the files they touched and are discarded when those change.
+    A write_file or delete_file call invalidates reads of that path and all script executions,
+    since scripts may read any file in the sandbox.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(function_name: str, function_args: dict) -> str:
+        args = dict(function_args)
+        if "file_path" in args:
+            args["file_path"] = _sandbox_path(args["file_path"])
+        if function_name == "search_internet":
+            args["query"] = " ".join(str(args.get("query", "")).lower().split())
+        return function_name + ":" + json.dumps(args, sort_keys=True)
+
+    def lookup(self, function_name: str, function_args: dict):
+        """
+        Returns the memoized result of a tool call, if it is still valid.
+
+        Args:
+            function_name (str): The tool name.
+            function_args (dict): The tool arguments.
+
+        Returns:
+            str: The memoized result, or None on a miss.
+        """
+        if function_name not in MEMOIZED_TOOLS:
+            return None
+        key = self._key(function_name, function_args)
+        with self._lock:
+            entry = self._entries.get(key)
+            valid = (
+                entry is not None
+                and entry["generation"] in (None, self._generation)
+                and all(_file_state(path) == state for path, state in entry["files"].items())
+            )
+            if valid:
+                self.hits[function_name] += 1
+                logging.info(f"Tool call served from memo: {function_name} {function_args}")
+                return entry["result"]
+            if entry is not None:
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses[function_name] += 1
+            return None
+
+    def record(self, function_name: str, function_args: dict, result: str):
+        """
+        Stores the result of a tool call, or invalidates entries affected by a write.
+
+        Args:
+            function_name (str): The tool name.
+            function_args (dict): The tool arguments.
+            result (str): The result returned by the tool.
+        """
+        if function_name in WRITING_TOOLS:
+            path = _sandbox_path(function_args.get("file_path", ""))
+            with self._lock:
+                self._generation += 1
+                stale = [
+                    key for key, entry in self._entries.items()
+                    if path in entry["files"] or entry["generation"] is not None
+                ]
+                for key in stale:
+                    del self._entries[key]
+                self.invalidations += len(stale)
+            return
+
+        # Failed calls are not stored so that they can be retried. The tools report any failure,
+        # including a single page of fetch_urls that could not be fetched, at the start of the result.
+        if function_name not in MEMOIZED_TOOLS or str(result).strip().lower().startswith(ERROR_PREFIXES):
+            return
+
+        files = {}
+        if "file_path" in function_args:
+            path = _sandbox_path(function_args["file_path"])
+            files[path] = _file_state(path)
+        with self._lock:
+            self._entries[self._key(function_name, function_args)] = {
+                "result": result,
+                "files": files,
+                "generation": self._generation if function_name == "execute_code_file" else None,
+            }
+
+    def stats(self) -> dict:
+        """
+        Summarizes memo usage.
+
+        Returns:
+            dict: Hits and misses per tool, and the number of invalidated entries.
+        """
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "invalidations": self.invalidations,
+            }
@@ -1,9 +1,24 @@
 # tools.py
 
+import json
 import logging
 import os
+import signal
 import subprocess
-from internet_access import search_internet
+import sys
+import threading
+import time
+from internet_access import search_internet, fetch_urls
+from memory import ERROR_PREFIXES
+from config import (
+    CODE_EXEC_TIMEOUT, CODE_EXEC_MAX_TIMEOUT, CODE_EXEC_OUTPUT_HEAD_BYTES, CODE_EXEC_OUTPUT_TAIL_BYTES,
+    CODE_EXEC_CPU_SECONDS, CODE_EXEC_MEMORY_BYTES, CODE_EXEC_FILE_SIZE_BYTES, CODE_EXEC_MAX_PROCESSES
+)
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
 # Define the sandbox directory path
 SANDBOX_DIR = os.path.join(os.getcwd(), 'sandbox')
@@ -56,15 +71,190 @@ def is_path_within_sandbox(file_path: str) -> bool:
         logging.exception(f"Error resolving paths for file: {file_path}")
         return False
 
-def tool_execute_code_file(file_path: str) -> str:
+class BoundedOutput:
+    """
+    Collects a byte stream while keeping only its head and tail, counting the bytes dropped in between.
+    """
+
+    def __init__(self, head_bytes: int = CODE_EXEC_OUTPUT_HEAD_BYTES, tail_bytes: int = CODE_EXEC_OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    def write(self, chunk: bytes):
+        """
+        Adds a chunk of output.
+
+        Args:
+            chunk (bytes): The bytes read from the stream.
+        """
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head.extend(chunk[:room])
+            chunk = chunk[room:]
+        if not chunk:
+            return
+        self.tail.extend(chunk)
+        overflow = len(self.tail) - self.tail_bytes
+        if overflow > 0:
+            del self.tail[:overflow]
+            self.dropped += overflow
+
+    def getvalue(self) -> str:
+        """
+        Returns the collected output, with a marker where bytes were dropped.
+
+        Returns:
+            str: The decoded output.
+        """
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"{head}\n[... {self.dropped} bytes omitted ...]\n{tail}"
+        return head + tail
+
+def _drain_stream(stream, output: BoundedOutput):
+    """Reads a pipe until EOF into a BoundedOutput."""
+    for chunk in iter(lambda: stream.read1(65536), b""):
+        output.write(chunk)
+    stream.close()
+
+# Applies the resource limits given as JSON in argv[1], then replaces itself with the script in argv[2].
+# The limits are set in the child rather than through preexec_fn, which is unsafe in threaded programs.
+_LIMITED_LAUNCHER = """
+import json, os, resource, sys
+for name, value in json.loads(sys.argv[1]).items():
+    try:
+        resource.setrlimit(getattr(resource, name), (value, value))
+    except (AttributeError, ValueError, OSError):
+        pass  # The hard limit is already lower, or the limit is not supported on this platform
+os.execv(sys.executable, [sys.executable, sys.argv[2]])
+"""
+
+def _python_command(full_path: str) -> list:
+    """
+    Builds the command that runs a Python file, under resource limits where the platform supports them.
+
+    Args:
+        full_path (str): Absolute path to the Python file.
+
+    Returns:
+        list[str]: The command line.
+    """
+    if resource is None:
+        return ["python3", full_path]
+    limits = {
+        "RLIMIT_CPU": CODE_EXEC_CPU_SECONDS,
+        "RLIMIT_AS": CODE_EXEC_MEMORY_BYTES,
+        "RLIMIT_FSIZE": CODE_EXEC_FILE_SIZE_BYTES,
+    }
+    if CODE_EXEC_MAX_PROCESSES is not None:
+        limits["RLIMIT_NPROC"] = CODE_EXEC_MAX_PROCESSES
+    return ["python3", "-c", _LIMITED_LAUNCHER, json.dumps(limits), full_path]
+
+def _kill_process_tree(process):
+    """Kills the process and every process in its session."""
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_python_file(full_path: str, timeout: float = CODE_EXEC_TIMEOUT):
+    """
+    Runs a Python file in a resource-limited subprocess, streaming its output into bounded buffers.
+
+    Args:
+        full_path (str): Absolute path to the Python file.
+        timeout (float): Wall-clock timeout in seconds.
+
+    Returns:
+        dict: "returncode", "stdout", "stderr", "timed_out", "wall_time", "cpu_time" (seconds or None),
+            and "peak_rss" (bytes or None).
+    """
+    posix = os.name == "posix"
+    start = time.monotonic()
+    process = subprocess.Popen(
+        _python_command(full_path),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=posix,
+    )
+
+    stdout, stderr = BoundedOutput(), BoundedOutput()
+    readers = [
+        threading.Thread(target=_drain_stream, args=(process.stdout, stdout), daemon=True),
+        threading.Thread(target=_drain_stream, args=(process.stderr, stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = threading.Event()
+    def on_timeout():
+        timed_out.set()
+        _kill_process_tree(process)
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+
+    cpu_time = peak_rss = None
+    try:
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            cpu_time = usage.ru_utime + usage.ru_stime
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        else:
+            process.wait()
+    finally:
+        timer.cancel()
+        # Grandchildren may still hold the pipes open
+        _kill_process_tree(process)
+        for reader in readers:
+            reader.join()
+
+    return {
+        "returncode": process.returncode,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "timed_out": timed_out.is_set(),
+        "wall_time": time.monotonic() - start,
+        "cpu_time": cpu_time,
+        "peak_rss": peak_rss,
+    }
+
+def format_usage(result: dict) -> str:
+    """
+    Formats the resource usage of a script run.
+
+    Args:
+        result (dict): The result of `run_python_file`.
+
+    Returns:
+        str: A one-line usage summary.
+    """
+    parts = [f"wall time {result['wall_time']:.2f}s"]
+    if result["cpu_time"] is not None:
+        parts.append(f"CPU time {result['cpu_time']:.2f}s")
+    if result["peak_rss"] is not None:
+        parts.append(f"peak memory {result['peak_rss'] / (1024 * 1024):.1f} MB")
+    return f"[Resource usage: {', '.join(parts)}]"
+
+def tool_execute_code_file(file_path: str, timeout: float = None) -> str:
     """
     Executes a Python file located within the sandbox directory.
     
     Args:
         file_path (str): The relative path to the Python file to execute within the sandbox directory.
+        timeout (float, optional): Wall-clock timeout in seconds, clamped to [1, CODE_EXEC_MAX_TIMEOUT].
     
     Returns:
-        str: The output or error from executing the code.
+        str: The output or error from executing the code, followed by its resource usage.
     """
     logging.info(f"Preparing to execute code file: {file_path}")
 
@@ -79,29 +269,31 @@ def tool_execute_code_file(file_path: str) -> str:
     # Ensure the sandbox directory exists
     ensure_sandbox_directory()
 
+    try:
+        timeout = float(timeout) if timeout is not None else CODE_EXEC_TIMEOUT
+    except (TypeError, ValueError):
+        timeout = CODE_EXEC_TIMEOUT
+    timeout = min(max(timeout, 1), CODE_EXEC_MAX_TIMEOUT)
+
     try:
         if not os.path.isfile(full_path):
             logging.error(f"File not found: {file_path}")
             return f"Error: File '{file_path}' does not exist."
 
-        # Execute the Python file using subprocess
-        logging.info(f"Executing Python file: {full_path}")
-        process = subprocess.run(
-            ["python3", full_path],
-            capture_output=True,
-            text=True,
-            timeout=10  # Prevent long-running executions
-        )
+        logging.info(f"Executing Python file: {full_path} (timeout {timeout}s)")
+        result = run_python_file(full_path, timeout=timeout)
+        usage = format_usage(result)
+        logging.info(f"Code execution finished. {usage}")
 
-        if process.returncode == 0:
+        if result["timed_out"]:
+            logging.error("Code execution timed out.")
+            return f"Error: Code execution timed out after {timeout:g} seconds.\n{result['stdout']}\n{usage}"
+        if result["returncode"] == 0:
             logging.info("Code executed successfully.")
-            return f"Code execution result:\n{process.stdout}"
+            return f"Code execution result:\n{result['stdout']}\n{usage}"
         else:
-            logging.error(f"Error executing code: {process.stderr}")
-            return f"Error executing code: {process.stderr}"
-    except subprocess.TimeoutExpired:
-        logging.error("Code execution timed out.")
-        return "Error: Code execution timed out."
+            logging.error(f"Error executing code: {result['stderr']}")
+            return f"Error executing code: {result['stderr']}\n{usage}"
     except Exception as e:
         logging.exception("Error occurred while executing code file.")
         return f"Error executing code file: {str(e)}"
@@ -119,11 +311,36 @@ def tool_search_internet(query: str) -> str:
     logging.info(f"Searching the internet for query: {query}")
     try:
         results = search_internet(query)
+        # Report failures as errors so they are not memoized and can be retried
+        if results.strip().lower().startswith("error"):
+            return results
+        if results.strip().lower().startswith(ERROR_PREFIXES):
+            return f"Error searching the internet: {results}"
         return "Internet search result:\n" + results
     except Exception as e:
         logging.exception("Error occurred during internet search.")
         return f"Error searching the internet: {str(e)}"
 
+def tool_fetch_urls(urls: list) -> str:
+    """
+    Downloads several web pages concurrently and returns their readable text.
+
+    Args:
+        urls (list): The URLs to fetch.
+
+    Returns:
+        str: The text of each page, truncated to fit the token budget, or an error message.
+    """
+    logging.info(f"Fetching URLs: {urls}")
+    try:
+        results = fetch_urls(urls)
+        if results.startswith("Error"):
+            return results
+        return "Fetched pages:\n" + results
+    except Exception as e:
+        logging.exception("Error occurred while fetching URLs.")
+        return f"Error fetching URLs: {str(e)}"
+
 def tool_read_file(file_path: str) -> str:
     """
     Reads the content of a file at the given path within the sandbox directory.
@@ -265,6 +482,10 @@ tools = [
                     "file_path": {
                         "type": "string",
                         "description": "The relative path to the Python file to execute within the sandbox directory."
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "description": f"Optional timeout in seconds (default {CODE_EXEC_TIMEOUT}, between 1 and {CODE_EXEC_MAX_TIMEOUT})."
                     }
                 },
                 "required": ["file_path"]
@@ -291,55 +512,56 @@ tools = [
     {
         "type": "function",
         "function": {
-            "name": "read_file",
-            "description": "Reads the content of a file at the given path within the sandbox directory.",
+            "name": "fetch_urls",
+            "description": "Downloads one or more web pages concurrently and returns their readable text. Use it to read pages found with search_internet.",
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "file_path": {
-                        "type": "string",
-                        "description": "The relative path to the file within the sandbox directory."
+                    "urls": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The http or https URLs to fetch."
                     }
                 },
-                "required": ["file_path"]
+                "required": ["urls"]
             }
         }
     },
     {
         "type": "function",
         "function": {
-            "name": "write_file",
-            "description": "Writes content to a file at the given path within the sandbox directory.",
+            "name": "read_file",
+            "description": "Reads the content of a file at the given path within the sandbox directory.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "file_path": {
                         "type": "string",
                         "description": "The relative path to the file within the sandbox directory."
-                    },
-                    "content": {
-                        "type": "string",
-                        "description": "The content to write."
                     }
                 },
-                "required": ["file_path", "content"]
+                "required": ["file_path"]
             }
         }
     },
     {
         "type": "function",
         "function": {
-            "name": "delete_file",
-            "description": "Deletes a specified file within the sandbox directory.",
+            "name": "write_file",
+            "description": "Writes content to a file at the given path within the sandbox directory.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "file_path": {
                         "type": "string",
-                        "description": "The relative path to the file within the sandbox directory that needs to be deleted."
+                        "description": "The relative path to the file within the sandbox directory."
+                    },
+                    "content": {
+                        "type": "string",
+                        "description": "The content to write."
                     }
                 },
-                "required": ["file_path"]
+                "required": ["file_path", "content"]
             }
         }
     },